@@ -0,0 +1,198 @@
+"""
+A minimal fake Telegram Bot API server for benchmarks.
+
+Serves `/bot<token>/<method>` like the real Bot API, queues updates for
+getUpdates (with long polling) and records every call made by the bot so that
+benchmarks can tell when a handler has replied.
+Optionally models network latency and flood control (429 responses with
+retry_after), except for getUpdates.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Callable
+
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application as TornadoApplication, RequestHandler
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "SDO bot", "username": "sdo_bot"}
+
+def make_user(user_id: int):
+  return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+def make_chat(chat_id: int):
+  if chat_id > 0:
+    return {"id": chat_id, "type": "private", "username": f"user{chat_id}"}
+  return {"id": chat_id, "type": "group", "title": f"Group {chat_id}"}
+
+def make_message_update(update_id: int, user_id: int, text: str, chat_id: int = None):
+  """Builds an update carrying a text message, with command entities like Telegram's."""
+  message = {
+    "message_id": update_id,
+    "date": int(time.time()),
+    "chat": make_chat(user_id if chat_id is None else chat_id),
+    "from": make_user(user_id),
+    "text": text,
+  }
+  if text.startswith("/"):
+    message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+  return {"update_id": update_id, "message": message}
+
+def make_callback_query_update(update_id: int, user_id: int, chat_id: int, message_id: int, data: str):
+  return {
+    "update_id": update_id,
+    "callback_query": {
+      "id": str(update_id),
+      "from": make_user(user_id),
+      "chat_instance": str(chat_id),
+      "data": data,
+      "message": {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": make_chat(chat_id),
+        "from": BOT_USER,
+        "text": "",
+      },
+    },
+  }
+
+def parse_parameter(value: str):
+  # the bot JSON-encodes every parameter that is not a plain string
+  try:
+    return json.loads(value)
+  except ValueError:
+    return value
+
+class FloodLimited(Exception):
+  def __init__(self, retry_after: int):
+    self.retry_after = retry_after
+
+class FakeBotAPI:
+  def __init__(self, latency: float = 0, retry_after_rate: float = 0, retry_after: int = 1):
+    """
+    `latency` is the mean delay in seconds before each call is answered.
+    `retry_after_rate` is the fraction of calls answered with a 429 asking the
+    bot to retry after `retry_after` seconds.
+    """
+    self.latency = latency
+    self.retry_after_rate = retry_after_rate
+    self.retry_after = retry_after
+    self.calls = []
+    self.flood_limited_calls = 0
+    self._listeners = []
+    self._updates = []
+    self._updates_available = asyncio.Condition()
+    self._update_ids = itertools.count(1)
+    self._next_message_id = 1
+    self._server = None
+    self.port = None
+
+  async def start(self, host: str = "127.0.0.1"):
+    app = TornadoApplication([(r"/bot([^/]+)/(\w+)", MethodHandler, {"api": self})])
+    sockets = bind_sockets(0, host)
+    self.port = sockets[0].getsockname()[1]
+    self._server = HTTPServer(app)
+    self._server.add_sockets(sockets)
+
+  async def stop(self):
+    # release long polls still waiting for updates
+    async with self._updates_available:
+      self._updates_available.notify_all()
+    self._server.stop()
+    await self._server.close_all_connections()
+
+  @property
+  def base_url(self):
+    return f"http://127.0.0.1:{self.port}/bot"
+
+  def add_listener(self, listener: Callable[[str, dict, float], None]):
+    """`listener(method, params, timestamp)` is called for every Bot API call."""
+    self._listeners.append(listener)
+
+  async def push_update(self, update: dict):
+    """Queues an update for getUpdates, replacing its update_id with the next in sequence."""
+    async with self._updates_available:
+      update["update_id"] = next(self._update_ids)
+      self._updates.append(update)
+      self._updates_available.notify_all()
+
+  async def get_updates(self, params: dict):
+    offset = int(params.get("offset", 0))
+    timeout = float(params.get("timeout", 0))
+
+    async with self._updates_available:
+      self._updates = [update for update in self._updates if update["update_id"] >= offset]
+      if not self._updates and timeout > 0:
+        try:
+          await asyncio.wait_for(self._updates_available.wait(), timeout)
+        except asyncio.TimeoutError:
+          pass
+      return self._updates[:int(params.get("limit", 100))]
+
+  def make_sent_message(self, params: dict):
+    message_id = self._next_message_id
+    self._next_message_id += 1
+    return {
+      "message_id": message_id,
+      "date": int(time.time()),
+      "chat": make_chat(int(params["chat_id"])),
+      "from": BOT_USER,
+      "text": params.get("text", ""),
+    }
+
+  async def call(self, method: str, params: dict):
+    if method.lower() != "getupdates":
+      if self.latency:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+      if random.random() < self.retry_after_rate:
+        self.flood_limited_calls += 1
+        raise FloodLimited(self.retry_after)
+
+    timestamp = time.perf_counter()
+    self.calls.append((method, params, timestamp))
+    for listener in self._listeners:
+      listener(method, params, timestamp)
+
+    method = method.lower()
+    if method == "getme":
+      return BOT_USER
+    elif method == "getupdates":
+      return await self.get_updates(params)
+    elif method == "getchat":
+      return make_chat(int(params["chat_id"]))
+    elif method in ("sendmessage", "senddocument"):
+      return self.make_sent_message(params)
+    elif method.startswith("edit"):
+      return {**self.make_sent_message(params), "message_id": int(params["message_id"])}
+    return True
+
+class MethodHandler(RequestHandler):
+  def initialize(self, api: FakeBotAPI):
+    self.api = api
+
+  async def post(self, token: str, method: str):
+    if self.request.headers.get("Content-Type", "").startswith("application/json"):
+      params = json.loads(self.request.body or b"{}")
+    else:
+      params = {
+        name: parse_parameter(self.get_body_argument(name))
+        for name in self.request.body_arguments
+      }
+      params.update({name: files[0].filename for name, files in self.request.files.items()})
+
+    try:
+      self.write({"ok": True, "result": await self.api.call(method, params)})
+    except FloodLimited as err:
+      self.set_status(429)
+      self.write({
+        "ok": False,
+        "error_code": 429,
+        "description": f"Too Many Requests: retry after {err.retry_after}",
+        "parameters": {"retry_after": err.retry_after},
+      })
+
+  get = post
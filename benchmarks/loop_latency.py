@@ -0,0 +1,114 @@
+"""
+Measures how much DB work delays the event loop while many requests are
+submitted concurrently, comparing synchronous sessions (the old pattern)
+with the async sessions used by the handlers.
+
+Usage (from the repository root):
+  python -m benchmarks.loop_latency [--submissions 200] [--groups 3]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db.classes import Base, Request, RequestNotification
+
+PROBE_INTERVAL = 0.001
+
+async def probe_loop_lag(lags: list, stop: asyncio.Event):
+  # the loop is blocked for however long a sleep overshoots its deadline
+  while not stop.is_set():
+    start = time.perf_counter()
+    await asyncio.sleep(PROBE_INTERVAL)
+    lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+def make_request_info(i):
+  return {
+    "rank_name": f"PTE Trainee {i}",
+    "start_date": time.time(),
+    "end_date": time.time(),
+    "reason": "Fever",
+    "course": "Nil",
+    "additional_info": "Nil",
+  }
+
+async def submit_sync(engine, i, groups):
+  with DBSession(engine, expire_on_commit=False) as db_session:
+    request = Request(sender_id=i, request_type="MC notification", info=make_request_info(i))
+    db_session.add(request)
+    db_session.commit()
+
+  # stands in for the Telegram round-trips between the two transactions
+  await asyncio.sleep(0)
+
+  with DBSession(engine) as db_session, db_session.begin():
+    db_session.execute(insert(RequestNotification), [
+      {"chat_id": -group, "message_id": i, "request_id": request.id}
+      for group in range(1, groups + 1)
+    ])
+
+async def submit_async(session_maker, i, groups):
+  async with session_maker() as db_session:
+    request = Request(sender_id=i, request_type="MC notification", info=make_request_info(i))
+    db_session.add(request)
+    await db_session.commit()
+
+  await asyncio.sleep(0)
+
+  async with session_maker() as db_session, db_session.begin():
+    await db_session.execute(insert(RequestNotification), [
+      {"chat_id": -group, "message_id": i, "request_id": request.id}
+      for group in range(1, groups + 1)
+    ])
+
+async def run(name, submit, submissions):
+  lags = []
+  stop = asyncio.Event()
+  probe = asyncio.create_task(probe_loop_lag(lags, stop))
+
+  start = time.perf_counter()
+  await asyncio.gather(*(submit(i) for i in range(submissions)))
+  elapsed = time.perf_counter() - start
+
+  stop.set()
+  await probe
+
+  lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+  print(
+    f"{name:>5}: {submissions / elapsed:8.1f} submissions/s | loop lag "
+    f"p50 {statistics.median(lags_ms):7.2f} ms, "
+    f"p99 {lags_ms[int(len(lags_ms) * 0.99)]:7.2f} ms, "
+    f"max {lags_ms[-1]:7.2f} ms "
+    f"({len(lags_ms)} probes)"
+  )
+
+async def main(submissions, groups):
+  with tempfile.TemporaryDirectory() as directory:
+    sync_path = os.path.join(directory, "sync.sqlite")
+    async_path = os.path.join(directory, "async.sqlite")
+
+    sync_engine = create_engine(f"sqlite:///{sync_path}")
+    Base.metadata.create_all(sync_engine)
+    await run("sync", lambda i: submit_sync(sync_engine, i, groups), submissions)
+    sync_engine.dispose()
+
+    Base.metadata.create_all(create_engine(f"sqlite:///{async_path}"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{async_path}")
+    session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
+    await run("async", lambda i: submit_async(session_maker, i, groups), submissions)
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--submissions", type=int, default=200)
+  parser.add_argument("--groups", type=int, default=3)
+  args = parser.parse_args()
+
+  asyncio.run(main(args.submissions, args.groups))
@@ -0,0 +1,350 @@
+"""
+Micro-benchmarks for utility functions and the per-request DB patterns of the
+handlers, with stored baselines.
+
+DB benchmarks run against a throwaway SQLite database seeded with 100k
+requests and their notifications. Each benchmark reports the best mean time
+per call over several repeats, which is far less noisy than the average.
+
+Usage (from the repository root):
+  python -m benchmarks.micro run [--filter callback_data]
+  python -m benchmarks.micro save       # stores results as the new baselines
+  python -m benchmarks.micro compare [--threshold 0.3]
+
+`compare` exits with status 1 if any benchmark is slower than its baseline by
+more than the threshold (a fraction), even after being measured again.
+Baselines are only meaningful on the machine they were saved on, so re-save
+them after changing machines.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, date, timezone, timedelta
+
+from benchmarks.sandbox import enter_sandbox
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SEEDED_REQUESTS = 100_000
+SEEDED_GROUPS = 3
+SEED_BATCH_SIZE = 5000
+REPEATS = 7
+MIN_RUN_TIME = 0.2
+REMEASURE_ATTEMPTS = 2
+
+REQUEST_TYPES = ("MC notification", "report sick notification", "BCP clearance request", "IPPT booking request", "enquiry")
+
+benchmarks = {}
+
+def benchmark(name, uses_db=False):
+  """
+  Registers a benchmark. The decorated function is called once to set up and
+  returns the function to time, which takes no arguments and may be async.
+  """
+  def register(setup):
+    benchmarks[name] = (setup, uses_db)
+    return setup
+  return register
+
+def get_tomorrow():
+  return datetime.now(timezone(timedelta(hours=8))) + timedelta(days=1)
+
+def make_fields(request_type, i):
+  tomorrow = get_tomorrow()
+  fields = {"rank_name": f"PTE Trainee {i}"}
+  if request_type == "MC notification":
+    fields.update(start_date=tomorrow.date(), end_date=tomorrow.date(), reason="Fever", course="Nil")
+  elif request_type == "report sick notification":
+    fields.update(location="PLMC", time=tomorrow, reason="Cough", course="Nil")
+  elif request_type == "BCP clearance request":
+    fields.update(date=tomorrow.date(), location="Carpark B", course="Nil", vehicle_number=f"SBA{i}A", purpose="Driving in")
+  elif request_type == "IPPT booking request":
+    fields.update(date=tomorrow.date(), participants=[f"PTE Trainee {i + j}" for j in range(5)])
+  else:
+    fields.update(course="Nil", enquiry="When is book out?")
+  fields["additional_info"] = "Nil"
+  return fields
+
+def make_request_info(request_type, i):
+  # as stored by complete_request
+  info = make_fields(request_type, i)
+  for field, value in info.items():
+    if isinstance(value, datetime):
+      info[field] = value.timestamp()
+    elif isinstance(value, date):
+      info[field] = datetime(value.year, value.month, value.day, tzinfo=timezone(timedelta(hours=8))).timestamp()
+  return info
+
+# utility functions
+
+@benchmark("summarize_request.mc")
+def bench_summarize_mc():
+  from utility.summarize_request import summarize_request
+  fields = make_fields("MC notification", 1)
+  return lambda: summarize_request("MC notification", fields)
+
+@benchmark("summarize_request.ippt")
+def bench_summarize_ippt():
+  from utility.summarize_request import summarize_request
+  fields = make_fields("IPPT booking request", 1)
+  return lambda: summarize_request("IPPT booking request", fields)
+
+@benchmark("validate_datetime_string")
+def bench_validate_datetime_string():
+  from utility.validate_datetime_string import validate_datetime_string
+  text = get_tomorrow().strftime("%d%m%y 0800H")
+  return lambda: validate_datetime_string(text, "%d%m%y %H%MH")
+
+@benchmark("validate_date_string")
+def bench_validate_date_string():
+  from utility.validate_datetime_string import validate_date_string
+  text = get_tomorrow().strftime("%d%m%y")
+  return lambda: validate_date_string(text, "%d%m%y")
+
+@benchmark("callback_data.make")
+def bench_make_callback_data():
+  from utility.callback_data import make_callback_data
+  from utility.constants import RequestCallbackType
+  return lambda: make_callback_data(RequestCallbackType.APPROVE, (123456,))
+
+@benchmark("callback_data.parse")
+def bench_parse_callback_data():
+  from utility.callback_data import make_callback_data, parse_callback_data
+  from utility.constants import RequestCallbackType
+  callback_data = make_callback_data(RequestCallbackType.APPROVE, (123456,))
+  return lambda: parse_callback_data(callback_data)
+
+@benchmark("callback_data.parse_legacy")
+def bench_parse_legacy_callback_data():
+  from utility.callback_data import parse_callback_data
+  return lambda: parse_callback_data("RequestCallbackType.APPROVE#123456")
+
+# DB patterns, against the seeded database
+
+@benchmark("db.insert_request", uses_db=True)
+def bench_insert_request():
+  from db import AsyncDBSession
+  from db.classes import Request
+  info = make_request_info("MC notification", 1)
+
+  async def insert_request():
+    async with AsyncDBSession() as db_session:
+      db_session.add(Request(sender_id=1, request_type="MC notification", info=dict(info)))
+      await db_session.commit()
+  return insert_request
+
+@benchmark("db.select_group_ids", uses_db=True)
+def bench_select_group_ids():
+  from sqlalchemy import select
+  from db import AsyncDBSession
+  from db.classes import ChatGroup
+
+  async def select_group_ids():
+    async with AsyncDBSession() as db_session:
+      (await db_session.scalars(select(ChatGroup.id))).all()
+  return select_group_ids
+
+@benchmark("db.insert_notifications", uses_db=True)
+def bench_insert_notifications():
+  from sqlalchemy import insert
+  from db import AsyncDBSession
+  from db.classes import RequestNotification
+  request_ids = random.Random(0)
+  message_ids = itertools.count(SEEDED_REQUESTS + 1)
+
+  async def insert_notifications():
+    request_id = request_ids.randint(1, SEEDED_REQUESTS)
+    message_id = next(message_ids)
+    async with AsyncDBSession() as db_session, db_session.begin():
+      await db_session.execute(insert(RequestNotification), [
+        {"chat_id": -group, "message_id": message_id, "request_id": request_id}
+        for group in range(1, SEEDED_GROUPS + 1)
+      ])
+  return insert_notifications
+
+@benchmark("db.select_request_with_notifications", uses_db=True)
+def bench_select_request():
+  from db import AsyncDBSession
+  from db.request_repository import get_request
+  request_ids = random.Random(0)
+
+  async def select_request_with_notifications():
+    async with AsyncDBSession() as db_session:
+      await get_request(db_session, request_ids.randint(1, SEEDED_REQUESTS))
+  return select_request_with_notifications
+
+@benchmark("db.update_request_status", uses_db=True)
+def bench_update_request_status():
+  from db import AsyncDBSession
+  from db.request_repository import get_request
+  from utility.constants import RequestStatus
+  request_ids = random.Random(0)
+
+  async def update_request_status():
+    # the load, modify and commit of every callback handler
+    async with AsyncDBSession() as db_session:
+      request = await get_request(db_session, request_ids.randint(1, SEEDED_REQUESTS))
+      request.status = RequestStatus.APPROVED if request.status != RequestStatus.APPROVED else RequestStatus.ACKNOWLEDGED
+      await db_session.commit()
+  return update_request_status
+
+@benchmark("db.select_enquiry", uses_db=True)
+def bench_select_enquiry():
+  from db import AsyncDBSession
+  from db.request_repository import get_request_of_type
+  request_ids = random.Random(0)
+
+  async def select_enquiry():
+    async with AsyncDBSession() as db_session:
+      await get_request_of_type(db_session, request_ids.randint(1, SEEDED_REQUESTS), "enquiry")
+  return select_enquiry
+
+def seed_database():
+  from sqlalchemy import insert
+  from db import engine
+  from db.classes import Request, RequestNotification, ChatGroup
+  from utility.constants import RequestStatus
+
+  statuses = list(RequestStatus)
+  rng = random.Random(0)
+  with engine.begin() as conn:
+    conn.execute(insert(ChatGroup), [{"id": -group} for group in range(1, SEEDED_GROUPS + 1)])
+    for batch_start in range(1, SEEDED_REQUESTS + 1, SEED_BATCH_SIZE):
+      batch = range(batch_start, min(batch_start + SEED_BATCH_SIZE, SEEDED_REQUESTS + 1))
+      requests = []
+      for i in batch:
+        request_type = REQUEST_TYPES[i % len(REQUEST_TYPES)]
+        status = rng.choice(statuses)
+        requests.append({
+          "id": i,
+          "sender_id": 10000 + i % 2000,
+          "request_type": request_type,
+          "info": make_request_info(request_type, i),
+          "status": status,
+          "resolved": request_type == "enquiry" and status == RequestStatus.APPROVED,
+        })
+      conn.execute(insert(Request), requests)
+      conn.execute(insert(RequestNotification), [
+        {"chat_id": -group, "message_id": i, "request_id": i}
+        for i in batch
+        for group in range(1, SEEDED_GROUPS + 1)
+      ])
+
+def time_per_call(function, loop):
+  if asyncio.iscoroutinefunction(function):
+    async def run_batch(number):
+      for _ in range(number):
+        await function()
+    run = lambda number: loop.run_until_complete(run_batch(number))
+  else:
+    def run(number):
+      for _ in range(number):
+        function()
+
+  # warm up caches and connection pools before timing
+  run(1)
+
+  # grow the batch until it runs long enough to time reliably
+  number = 1
+  while True:
+    start = time.perf_counter()
+    run(number)
+    elapsed = time.perf_counter() - start
+    if elapsed >= MIN_RUN_TIME:
+      break
+    number *= 2 if elapsed == 0 else max(2, min(10, int(MIN_RUN_TIME / elapsed * 1.2)))
+
+  best = elapsed / number
+  for _ in range(REPEATS - 1):
+    start = time.perf_counter()
+    run(number)
+    best = min(best, (time.perf_counter() - start) / number)
+  return best
+
+def run_benchmarks(name_filter, baselines=None, threshold=None):
+  """
+  Returns the time per call of each selected benchmark. When given baselines,
+  a benchmark that looks regressed is measured again (keeping the best time),
+  so that a single noisy measurement does not fail the comparison.
+  """
+  selected = {name: benchmark for name, benchmark in benchmarks.items() if name_filter in name}
+  if any(uses_db for _, uses_db in selected.values()):
+    print(f"Seeding database with {SEEDED_REQUESTS} requests...", file=sys.stderr)
+    seed_database()
+
+  loop = asyncio.new_event_loop()
+  results = {}
+  for name, (setup, _) in selected.items():
+    function = setup()
+    results[name] = time_per_call(function, loop)
+    baseline = (baselines or {}).get(name)
+    for _ in range(REMEASURE_ATTEMPTS):
+      if baseline is None or results[name] / baseline - 1 <= threshold:
+        break
+      results[name] = min(results[name], time_per_call(function, loop))
+    print(f"{name:<40} {results[name] * 1e6:>12.2f} us", file=sys.stderr)
+  loop.close()
+  return results
+
+def load_baselines():
+  try:
+    with open(BASELINES_PATH) as baselines_file:
+      return json.load(baselines_file)["results"]
+  except FileNotFoundError:
+    return {}
+
+def save_baselines(results):
+  baselines = load_baselines()
+  baselines.update(results)
+  with open(BASELINES_PATH, "w") as baselines_file:
+    json.dump({
+      "machine": f"{platform.node()} ({platform.machine()}, {platform.python_implementation()} {platform.python_version()})",
+      "saved_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+      "results": dict(sorted(baselines.items())),
+    }, baselines_file, indent=2)
+    baselines_file.write("\n")
+
+def compare(results, baselines, threshold):
+  """Prints results against the baselines. Returns whether any benchmark regressed."""
+  regressed = False
+  print(f"{'benchmark':<40} {'baseline us':>12} {'current us':>12} {'change':>8}")
+  for name, seconds in results.items():
+    baseline = baselines.get(name)
+    if baseline is None:
+      print(f"{name:<40} {'-':>12} {seconds * 1e6:>12.2f} {'new':>8}")
+      continue
+
+    change = seconds / baseline - 1
+    is_regression = change > threshold
+    regressed |= is_regression
+    print(
+      f"{name:<40} {baseline * 1e6:>12.2f} {seconds * 1e6:>12.2f} {change:>+8.1%}"
+      f"{'  REGRESSION' if is_regression else ''}"
+    )
+  return regressed
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("command", choices=("run", "save", "compare"))
+  parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+  parser.add_argument("--threshold", type=float, default=0.3, help="slowdown tolerated by compare, as a fraction")
+  args = parser.parse_args()
+
+  enter_sandbox({})
+  logging.disable(logging.WARNING)
+  if args.command == "compare":
+    baselines = load_baselines()
+    results = run_benchmarks(args.filter, baselines, args.threshold)
+    sys.exit(1 if compare(results, baselines, args.threshold) else 0)
+
+  results = run_benchmarks(args.filter)
+  if args.command == "save":
+    save_baselines(results)
+    print(f"Saved {len(results)} baseline(s) to {BASELINES_PATH}")
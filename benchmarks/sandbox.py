@@ -0,0 +1,27 @@
+"""
+Runs a benchmark against a throwaway working directory, so that it never
+touches the real bot_config.json or database.
+Must be called before anything that imports `db` or reads the bot config.
+"""
+
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def enter_sandbox(bot_config: dict) -> str:
+  directory = tempfile.mkdtemp(prefix="sdo-bot-benchmark-")
+  atexit.register(shutil.rmtree, directory, ignore_errors=True)
+
+  os.makedirs(os.path.join(directory, "db"))
+  with open(os.path.join(directory, "bot_config.json"), "w") as bot_config_file:
+    json.dump(bot_config, bot_config_file)
+
+  if REPOSITORY_ROOT not in sys.path:
+    sys.path.insert(0, REPOSITORY_ROOT)
+  os.chdir(directory)
+  return directory
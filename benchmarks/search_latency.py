@@ -0,0 +1,120 @@
+"""
+Measures /search latency against a large SQLite database.
+
+Seeds a throwaway database with requests whose contents resemble real ones,
+indexed through the FTS5 triggers, then times `db.search.search_requests`
+(through the same read-only session as the handler) for rare, common,
+multi-term and prefix queries. Reports p50/p95 latency per query against the
+target.
+
+Usage (from the repository root):
+  python -m benchmarks.search_latency [--rows 1000000] [--runs 50]
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from benchmarks.sandbox import enter_sandbox
+
+TARGET_P95_MS = 100
+SEED_BATCH_SIZE = 10000
+
+RANKS = ["REC", "PTE", "LCP", "CPL", "3SG", "2SG", "ME1", "ME2", "2LT", "LTA"]
+SURNAMES = ["Tan", "Lim", "Lee", "Ng", "Ong", "Wong", "Goh", "Chua", "Chan", "Koh", "Teo", "Ang", "Yeo", "Tay", "Ho",
+            "Low", "Toh", "Sim", "Chong", "Chia", "Kumar", "Singh", "Rahman", "Ismail", "Abdullah"]
+COURSES = ["AVN FLT 12", "AVN FLT 13", "AVN FLT 14", "BMT 3", "Nil"]
+LOCATIONS = ["Medical centre", "Polyclinic", "Changi General Hospital", "Sengkang clinic", "Tengah camp"]
+REASONS = ["Fever", "Cough and flu", "Sprained ankle", "Gastric pain", "Migraine", "Back pain", "Family matters",
+           "Medical appointment", "Dental appointment"]
+ENQUIRIES = ["When is the next IPPT window?", "Can I book out early on Friday?", "How do I apply for leave?",
+             "Is the gym open on weekends?", "Who do I contact about my pay?"]
+REQUEST_TYPES = ["MC notification", "report sick notification", "BCP clearance request", "enquiry"]
+
+def make_vehicle_number(rng: random.Random) -> str:
+  return f"S{rng.choice('BCDEFGHJKL')}{rng.choice('ABCDEFGHJKLMNPRSTUXYZ')}{rng.randint(1, 9999)}{rng.choice('ABCDEGHJKLMPRSTUXYZ')}"
+
+def make_request(rng: random.Random, i: int) -> dict:
+  request_type = REQUEST_TYPES[i % len(REQUEST_TYPES)]
+  info = {
+    "rank_name": f"{rng.choice(RANKS)} {rng.choice(SURNAMES)} Trainee{i}",
+    "course": rng.choice(COURSES),
+  }
+  if request_type == "MC notification":
+    info.update(start_date=time.time(), end_date=time.time(), reason=rng.choice(REASONS), additional_info="Nil")
+  elif request_type == "report sick notification":
+    info.update(time=time.time(), location=rng.choice(LOCATIONS), reason=rng.choice(REASONS), additional_info="Nil")
+  elif request_type == "BCP clearance request":
+    info.update(date=time.time(), location="Tengah camp", vehicle_number=make_vehicle_number(rng),
+                purpose="Drive in to camp", additional_info="Nil")
+  else:
+    info.update(enquiry=rng.choice(ENQUIRIES), additional_info="Nil")
+  return {"sender_id": 10000 + i, "request_type": request_type, "info": info}
+
+def seed_requests(row_count: int) -> dict:
+  """Returns sample values that occur in exactly one request."""
+  from sqlalchemy import insert
+  from db import engine
+  from db.classes import Request
+
+  rng = random.Random(0)
+  samples = {}
+  start = time.perf_counter()
+  with engine.begin() as conn:
+    for batch_start in range(0, row_count, SEED_BATCH_SIZE):
+      rows = [make_request(rng, i) for i in range(batch_start, min(batch_start + SEED_BATCH_SIZE, row_count))]
+      conn.execute(insert(Request), rows)
+      for row in rows:
+        if "vehicle_number" in row["info"]:
+          samples["vehicle_number"] = row["info"]["vehicle_number"]
+  print(f"Seeded {row_count} requests in {time.perf_counter() - start:.1f} s")
+  samples["name"] = f"Trainee{row_count // 2}"
+  return samples
+
+def percentile(sorted_values, fraction):
+  return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def time_query(terms, runs):
+  from db import ReadOnlyDBSession
+  from db.search import search_requests
+
+  latencies = []
+  result_count = 0
+  for _ in range(runs):
+    start = time.perf_counter()
+    async with ReadOnlyDBSession() as db_session:
+      result_count = len(await search_requests(db_session, terms))
+    latencies.append(time.perf_counter() - start)
+  return sorted(latencies), result_count
+
+async def main(args):
+  samples = seed_requests(args.rows)
+  queries = {
+    "vehicle number": [samples["vehicle_number"]],
+    "vehicle number prefix": [samples["vehicle_number"][:4]],
+    "unique name": [samples["name"]],
+    "type + term": ["enquiry", "IPPT"],
+    "common term": ["fever"],
+    "very common term": ["nil"],
+  }
+
+  print(f"\n{'query':<24} {'results':>8} {'p50 ms':>9} {'p95 ms':>9}  target p95 {TARGET_P95_MS} ms")
+  for name, terms in queries.items():
+    latencies, result_count = await time_query(terms, args.runs)
+    p95_ms = percentile(latencies, 0.95) * 1000
+    print(
+      f"{name:<24} {result_count:>8} {percentile(latencies, 0.5) * 1000:>9.2f} {p95_ms:>9.2f}  "
+      f"{'ok' if p95_ms <= TARGET_P95_MS else 'MISSED'}"
+    )
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--rows", type=int, default=1000000)
+  parser.add_argument("--runs", type=int, default=50, help="times each query is run")
+  args = parser.parse_args()
+
+  enter_sandbox({})
+  logging.disable(logging.WARNING)
+  asyncio.run(main(args))
@@ -0,0 +1,128 @@
+"""
+Compares end-to-end update handling latency in webhook and polling mode.
+
+Recorded updates are delivered to the Application built by main.py, either by
+posting them to its webhook endpoint or by queueing them for getUpdates on a
+fake Bot API server. Latency is measured from delivery until the bot's reply
+reaches the fake server.
+
+Usage (from the repository root):
+  python -m benchmarks.webhook_latency [--updates 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from tornado.netutil import bind_sockets
+
+from benchmarks.fake_bot_api import FakeBotAPI, make_message_update
+from benchmarks.sandbox import enter_sandbox
+
+TOKEN = "123456:benchmark"
+SECRET_TOKEN = "benchmark-secret"
+RECORDED_COMMANDS = ("/help", "/start")
+
+def get_free_port():
+  sockets = bind_sockets(0, "127.0.0.1")
+  port = sockets[0].getsockname()[1]
+  for sock in sockets:
+    sock.close()
+  return port
+
+async def measure(mode, fake_api, update_count):
+  from main import build_application, get_webhook_options
+
+  webhook_port = get_free_port()
+  bot_config = {
+    "bot_token": TOKEN,
+    "base_url": fake_api.base_url,
+    "webhook": {
+      "listen": "127.0.0.1",
+      "port": webhook_port,
+      "url_path": "webhook",
+      "secret_token": SECRET_TOKEN,
+    },
+  }
+
+  replies = {}
+
+  def on_call(method, params, timestamp):
+    if method != "sendMessage":
+      return
+    reply = replies.get(int(params["chat_id"]))
+    if reply is not None and not reply.done():
+      reply.set_result(timestamp)
+
+  fake_api.add_listener(on_call)
+
+  app = build_application(bot_config)
+  await app.initialize()
+  if app.post_init:
+    await app.post_init(app)
+  await app.start()
+
+  if mode == "webhook":
+    await app.updater.start_webhook(**get_webhook_options(bot_config))
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{webhook_port}")
+
+    forged = await client.post("/webhook", json=make_message_update(0, 1, "/help"))
+    assert forged.status_code == 403, "webhook accepted an update without the secret token"
+
+    async def deliver(update):
+      response = await client.post(
+        "/webhook",
+        json=update,
+        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN},
+      )
+      response.raise_for_status()
+  else:
+    await app.updater.start_polling(timeout=10)
+
+    async def deliver(update):
+      await fake_api.push_update(update)
+
+  latencies = []
+  start = time.perf_counter()
+  for i in range(1, update_count + 1):
+    user_id = 1000 + i
+    replies[user_id] = asyncio.get_running_loop().create_future()
+    sent_at = time.perf_counter()
+    await deliver(make_message_update(i, user_id, RECORDED_COMMANDS[i % len(RECORDED_COMMANDS)]))
+    latencies.append(await asyncio.wait_for(replies[user_id], 10) - sent_at)
+  elapsed = time.perf_counter() - start
+
+  if mode == "webhook":
+    await client.aclose()
+  await app.updater.stop()
+  await app.stop()
+  if app.post_stop:
+    await app.post_stop(app)
+  await app.shutdown()
+
+  latencies_ms = sorted(latency * 1000 for latency in latencies)
+  print(
+    f"{mode:>7}: {update_count / elapsed:7.1f} updates/s | latency "
+    f"p50 {statistics.median(latencies_ms):6.2f} ms, "
+    f"p95 {latencies_ms[int(len(latencies_ms) * 0.95)]:6.2f} ms, "
+    f"max {latencies_ms[-1]:6.2f} ms"
+  )
+
+async def main(update_count):
+  for mode in ("polling", "webhook"):
+    fake_api = FakeBotAPI()
+    await fake_api.start()
+    await measure(mode, fake_api, update_count)
+    await fake_api.stop()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--updates", type=int, default=200)
+  args = parser.parse_args()
+
+  enter_sandbox({})
+  logging.disable(logging.WARNING)
+  asyncio.run(main(args.updates))
@@ -1,6 +1,23 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from .classes import Base
+from utility.bot_config import get_bot_config
+from .engines import create_engines
+from .migrations import migrate
+from .query_log import configure_query_log, log_queries
 
-engine = create_engine("sqlite:///./db/db.sqlite", echo=True)
-Base.metadata.create_all(engine)
+configure_query_log(**get_bot_config().get("query_log", {}))
+
+# engine is synchronous, for startup tasks and scripts. Handlers must use the
+# async engines so that DB I/O does not block the event loop.
+engine, async_engine, read_only_async_engine = create_engines(get_bot_config().get("database", {}))
+for logged_engine in (engine, async_engine.sync_engine, read_only_async_engine.sync_engine):
+  log_queries(logged_engine)
+
+migrate(engine)
+
+# expire_on_commit is disabled because expired attributes cannot be
+# lazily reloaded in an async session
+AsyncDBSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# for sessions that only read, so that they are not held up behind writes
+ReadOnlyDBSession = async_sessionmaker(read_only_async_engine, expire_on_commit=False)
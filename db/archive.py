@@ -0,0 +1,72 @@
+"""
+Moves finished requests out of the tables that handlers query.
+
+A request is finished once it is approved or rejected, and for enquiries, also
+resolved. Finished requests are copied to the archive tables together with
+their notifications and verdict notification, then deleted, one small batch
+per transaction so that the write lock is never held for long. Lookups in
+`db.request_repository` fall back to the archive.
+"""
+
+import time
+from sqlalchemy import select, insert, delete, func, literal, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utility.constants import RequestStatus
+from .classes import Request, RequestNotification, RequestVerdictNotification, \
+                     ArchivedRequest, ArchivedRequestNotification, ArchivedRequestVerdictNotification
+
+IS_FINISHED = Request.status.in_((RequestStatus.APPROVED, RequestStatus.REJECTED)) \
+              & or_(Request.request_type != "enquiry", Request.resolved)
+
+def select_archivable_ids(cutoff: float, batch_size: int):
+  return select(Request.id) \
+    .where(
+      IS_FINISHED,
+      Request.created_at < cutoff,
+      # SQLite reuses the highest ID if its row is deleted, which would reuse
+      # the reference no. of an archived request, so the newest one is kept
+      Request.id < select(func.max(Request.id)).scalar_subquery(),
+    ) \
+    .order_by(Request.id) \
+    .limit(batch_size) \
+    .with_for_update(skip_locked=True)
+
+async def archive_batch(db_session: AsyncSession, cutoff: float, batch_size: int) -> int:
+  """
+  Archives up to `batch_size` requests finished and created before `cutoff`
+  (Unix time). Returns the number archived. Must be called in a transaction.
+  """
+  request_ids = (await db_session.scalars(select_archivable_ids(cutoff, batch_size))).all()
+  if not request_ids:
+    return 0
+
+  await db_session.execute(
+    insert(ArchivedRequest).from_select(
+      ["id", "sender_id", "request_type", "info", "status", "resolved", "created_at", "archived_at"],
+      select(
+        Request.id,
+        Request.sender_id,
+        Request.request_type,
+        Request.info,
+        Request.status,
+        Request.resolved,
+        Request.created_at,
+        literal(time.time()),
+      ).where(Request.id.in_(request_ids)),
+    )
+  )
+  for table, archive_table in (
+    (RequestNotification, ArchivedRequestNotification),
+    (RequestVerdictNotification, ArchivedRequestVerdictNotification),
+  ):
+    await db_session.execute(
+      insert(archive_table).from_select(
+        ["chat_id", "message_id", "request_id"],
+        select(table.chat_id, table.message_id, table.request_id).where(table.request_id.in_(request_ids)),
+      )
+    )
+    await db_session.execute(delete(table).where(table.request_id.in_(request_ids)))
+
+  await db_session.execute(delete(Request).where(Request.id.in_(request_ids)))
+  return len(request_ids)
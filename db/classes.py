@@ -1,12 +1,23 @@
-from sqlalchemy import ForeignKey, Boolean, Integer, Enum as SQLEnum, Float, Text
+from sqlalchemy import ForeignKey, Index, Boolean, Integer, BigInteger, String, Enum as SQLEnum, Float, Text, LargeBinary, Date, false
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy_json import MutableJson
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, date
+import time
 
 from utility.constants import RequestStatus
 
-# TODO: define indices for faster queries
+# Indices added to existing tables also need a migration in db/migrations.py
+# so that they are created in databases made by earlier versions of the bot.
+
+# Telegram user and chat IDs need up to 52 bits. SQLite's INTEGER is already
+# 64-bit, and keeping it there leaves existing SQLite schemas unchanged.
+TelegramID = BigInteger().with_variant(Integer(), "sqlite")
+
+# created_at of requests made before it was recorded, whose real submission
+# time is unknown. It is earlier than any real time, so they fall outside every
+# date range and count as old enough to archive once finished.
+UNKNOWN_CREATED_AT = 0
 
 
 class Base(DeclarativeBase):
@@ -15,14 +26,25 @@ class Base(DeclarativeBase):
 
 class Request(Base):
   __tablename__ = "Request"
+  __table_args__ = (
+    # also serves queries filtering by request_type alone
+    Index("ix_Request_request_type_resolved", "request_type", "resolved"),
+    # for keyset pagination of requests by status; also serves queries filtering by status alone
+    Index("ix_Request_status_id", "status", "id"),
+  )
 
   id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-  sender_id: Mapped[int] = mapped_column(Integer())
+  sender_id: Mapped[int] = mapped_column(TelegramID, index=True)
+  request_type: Mapped[str] = mapped_column(String())
   info: Mapped[dict] = mapped_column(MutableJson)
   status: Mapped[RequestStatus] = mapped_column(
     SQLEnum(RequestStatus, create_constraint=False),
     default=RequestStatus.PENDING_ACKNOWLEDGEMENT,
   )
+  # only meaningful for enquiries
+  resolved: Mapped[bool] = mapped_column(Boolean(), default=False, server_default=false())
+  # Unix time, or UNKNOWN_CREATED_AT for requests made before this column was added
+  created_at: Mapped[float] = mapped_column(Float(), default=time.time)
   
   notifications: Mapped[List["RequestNotification"]] = relationship(
     back_populates="request",
@@ -35,21 +57,65 @@ class Request(Base):
 class RequestNotification(Base):
   __tablename__ = "RequestNotification"
 
-  chat_id: Mapped[int] = mapped_column(primary_key=True)
+  chat_id: Mapped[int] = mapped_column(TelegramID, primary_key=True)
   message_id: Mapped[int] = mapped_column(primary_key=True)
-  request_id: Mapped[int] = mapped_column(ForeignKey("Request.id"))
+  request_id: Mapped[int] = mapped_column(ForeignKey("Request.id"), index=True)
   request: Mapped["Request"] = relationship(back_populates="notifications")
 
 
 class RequestVerdictNotification(Base):
   __tablename__ = "RequestVerdictNotification"
 
-  chat_id: Mapped[int] = mapped_column(primary_key=True)
+  chat_id: Mapped[int] = mapped_column(TelegramID, primary_key=True)
   message_id: Mapped[int] = mapped_column(primary_key=True)
-  request_id: Mapped[int] = mapped_column(ForeignKey("Request.id"))
+  request_id: Mapped[int] = mapped_column(ForeignKey("Request.id"), index=True)
   request: Mapped["Request"] = relationship(back_populates="verdict_notification")
 
 
+# Finished requests are moved to the tables below once they are old enough
+# (see db/archive.py). Archived requests keep their IDs.
+
+class ArchivedRequest(Base):
+  __tablename__ = "ArchivedRequest"
+
+  id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+  sender_id: Mapped[int] = mapped_column(TelegramID)
+  request_type: Mapped[str] = mapped_column(String())
+  info: Mapped[dict] = mapped_column(MutableJson)
+  status: Mapped[RequestStatus] = mapped_column(SQLEnum(RequestStatus, create_constraint=False))
+  resolved: Mapped[bool] = mapped_column(Boolean())
+  created_at: Mapped[float] = mapped_column(Float())
+  archived_at: Mapped[float] = mapped_column(Float())
+
+
+class ArchivedRequestNotification(Base):
+  __tablename__ = "ArchivedRequestNotification"
+
+  chat_id: Mapped[int] = mapped_column(TelegramID, primary_key=True)
+  message_id: Mapped[int] = mapped_column(primary_key=True)
+  request_id: Mapped[int] = mapped_column(ForeignKey("ArchivedRequest.id"), index=True)
+
+
+class ArchivedRequestVerdictNotification(Base):
+  __tablename__ = "ArchivedRequestVerdictNotification"
+
+  chat_id: Mapped[int] = mapped_column(TelegramID, primary_key=True)
+  message_id: Mapped[int] = mapped_column(primary_key=True)
+  request_id: Mapped[int] = mapped_column(ForeignKey("ArchivedRequest.id"), index=True)
+
+
+class ParadeStateCount(Base):
+  __tablename__ = "ParadeStateCount"
+
+  # Counts of requests that apply to a day, maintained by db/parade_state.py
+  # in the same transactions that submit requests and change their status.
+  day: Mapped[date] = mapped_column(Date(), primary_key=True)
+  request_type: Mapped[str] = mapped_column(String(), primary_key=True)
+  submitted: Mapped[int] = mapped_column(default=0)
+  approved: Mapped[int] = mapped_column(default=0)
+  rejected: Mapped[int] = mapped_column(default=0)
+
+
 class SDOLogEntry(Base):
   __tablename__ = "SDOLogEntry"
 
@@ -60,12 +126,55 @@ class SDOLogEntry(Base):
   # the time difference between insertion of two different rows will
   # make it impossible to reliably retrieve all incoming SDOs
   # associated with the most recent HOTO
-  time: Mapped[float] = mapped_column(Float())
-  sdo_id: Mapped[int] = mapped_column(Integer())
+  time: Mapped[float] = mapped_column(Float(), index=True)
+  sdo_id: Mapped[int] = mapped_column(TelegramID)
   sdo_info: Mapped[str] = mapped_column(Text())
 
 
 class ChatGroup(Base):
   __tablename__ = "BotMemberGroup"
 
-  id: Mapped[int] = mapped_column(primary_key=True)
+  id: Mapped[int] = mapped_column(TelegramID, primary_key=True, autoincrement=False)
+
+
+class SchemaVersion(Base):
+  __tablename__ = "SchemaVersion"
+
+  # single row holding the number of migrations applied to this database
+  version: Mapped[int] = mapped_column(primary_key=True)
+
+
+class UserProfile(Base):
+  __tablename__ = "UserProfile"
+
+  # Telegram user ID
+  id: Mapped[int] = mapped_column(TelegramID, primary_key=True, autoincrement=False)
+  username: Mapped[Optional[str]] = mapped_column(Text())
+  updated_at: Mapped[float] = mapped_column(Float())
+
+
+# Tables below are used by internal.db_persistence.DBPersistence.
+# Values are pickled user_data/chat_data dicts and conversation states.
+
+class PersistedUserData(Base):
+  __tablename__ = "PersistedUserData"
+
+  user_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True, autoincrement=False)
+  data: Mapped[bytes] = mapped_column(LargeBinary())
+
+
+class PersistedChatData(Base):
+  __tablename__ = "PersistedChatData"
+
+  chat_id: Mapped[int] = mapped_column(BigInteger(), primary_key=True, autoincrement=False)
+  data: Mapped[bytes] = mapped_column(LargeBinary())
+
+
+class PersistedConversation(Base):
+  __tablename__ = "PersistedConversation"
+
+  # name of the ConversationHandler
+  name: Mapped[str] = mapped_column(String(), primary_key=True)
+  # JSON-encoded conversation key, e.g. "[chat_id, user_id]"
+  key: Mapped[str] = mapped_column(String(), primary_key=True)
+  state: Mapped[bytes] = mapped_column(LargeBinary())
@@ -0,0 +1,76 @@
+"""
+Creates the database engines from the "database" section of bot_config.json.
+
+`url` is a synchronous SQLAlchemy URL (default: the SQLite file in ./db). The
+async engines used by handlers get the matching async driver (aiosqlite or
+asyncpg) unless `async_url` is given. `engine_options` are passed to every
+`create_engine` call, e.g. to size connection pools.
+
+SQLite connections are tuned with PRAGMAs (see `DEFAULT_SQLITE_PRAGMAS`,
+overridable through `sqlite_pragmas`). The async engines keep them open in a
+pool, as the sync engine does, instead of aiosqlite's default of opening a new
+connection, with its own thread and PRAGMAs, for every session. In WAL mode
+readers do not block the writer, so read paths get their own pool of
+query-only connections and are not held up behind writes. Other databases use
+`read_only_url` (e.g. a replica) for reads if given, or else share the main
+async engine.
+"""
+
+from sqlalchemy import Engine, URL, AsyncAdaptedQueuePool, create_engine, event, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+DEFAULT_DATABASE_URL = "sqlite:///./db/db.sqlite"
+
+DEFAULT_SQLITE_PRAGMAS = {
+  # readers and the writer no longer block each other
+  "journal_mode": "WAL",
+  # in WAL mode, only a power loss can lose the last transactions, never corrupt the database
+  "synchronous": "NORMAL",
+  # milliseconds to wait for a lock before failing with "database is locked"
+  "busy_timeout": 5000,
+  "mmap_size": 256 * 1024 * 1024,
+}
+
+ASYNC_DRIVERS = {
+  "sqlite": "sqlite+aiosqlite",
+  "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_url(url: URL) -> URL:
+  async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+  if async_driver is None:
+    raise ValueError(f"No known async driver for {url.get_backend_name()}. Set database.async_url in bot_config.json.")
+  return url.set(drivername=async_driver)
+
+def set_sqlite_pragmas(engine: Engine, pragmas: dict):
+  @event.listens_for(engine, "connect")
+  def on_connect(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+      cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+def create_engines(database_config: dict):
+  """Returns the synchronous engine, the async engine and the async engine for reads."""
+  url = make_url(database_config.get("url", DEFAULT_DATABASE_URL))
+  async_url = make_url(database_config["async_url"]) if "async_url" in database_config else get_async_url(url)
+  engine_options = database_config.get("engine_options", {})
+
+  engine = create_engine(url, **engine_options)
+
+  if url.get_backend_name() != "sqlite":
+    async_engine = create_async_engine(async_url, **engine_options)
+    read_only_async_engine = create_async_engine(database_config["read_only_url"], **engine_options) \
+                             if "read_only_url" in database_config else async_engine
+    return engine, async_engine, read_only_async_engine
+
+  pragmas = {**DEFAULT_SQLITE_PRAGMAS, **database_config.get("sqlite_pragmas", {})}
+  async_engine_options = engine_options
+  if url.database not in (None, "", ":memory:"):
+    async_engine_options = {"poolclass": AsyncAdaptedQueuePool, **engine_options}
+  async_engine = create_async_engine(async_url, **async_engine_options)
+  read_only_async_engine = create_async_engine(async_url, **async_engine_options)
+  set_sqlite_pragmas(engine, pragmas)
+  set_sqlite_pragmas(async_engine.sync_engine, pragmas)
+  set_sqlite_pragmas(read_only_async_engine.sync_engine, {**pragmas, "query_only": "ON"})
+  return engine, async_engine, read_only_async_engine
@@ -0,0 +1,153 @@
+"""
+Versioned schema migrations, applied in place at startup.
+
+A migration is a function taking a `sqlalchemy.Connection` that upgrades the
+schema by one version. The version of a database is the number of migrations
+that have been applied to it, and is stored in the `SchemaVersion` table.
+To change the schema of an existing table, update `db/classes.py` and append a
+migration to `MIGRATIONS`. Never edit or reorder migrations that have shipped.
+"""
+
+import logging
+import os
+import time
+from sqlalchemy import Engine, Connection, Column, inspect, select, insert, update, bindparam, text
+
+from .classes import Base, Request, RequestNotification, RequestVerdictNotification, SDOLogEntry, SchemaVersion, UserProfile, \
+                     PersistedUserData, PersistedChatData, PersistedConversation, \
+                     ArchivedRequest, ArchivedRequestNotification, ArchivedRequestVerdictNotification, ParadeStateCount, \
+                     UNKNOWN_CREATED_AT
+from .parade_state import count_existing_requests
+from .search import create_search_indices
+
+logger = logging.getLogger(__name__)
+
+def create_indices(conn: Connection):
+  for column in (
+    Request.sender_id,
+    Request.status,
+    RequestNotification.request_id,
+    RequestVerdictNotification.request_id,
+    SDOLogEntry.time,
+  ):
+    for index in column.table.indexes:
+      if index.columns.keys() == [column.key]:
+        index.create(conn, checkfirst=True)
+
+def add_column(conn: Connection, column: Column, default: str):
+  quote = conn.dialect.identifier_preparer.quote
+  conn.execute(text(
+    f"ALTER TABLE {quote(column.table.name)} ADD COLUMN {quote(column.name)} "
+    f"{column.type.compile(conn.dialect)} NOT NULL DEFAULT {default}"
+  ))
+
+def promote_request_type_and_resolved(conn: Connection):
+  # info["type"] and info["resolved"] are left in place for old requests
+  add_column(conn, Request.__table__.c.request_type, "''")
+  add_column(conn, Request.__table__.c.resolved, "FALSE")
+
+  batch_size = 1000
+  last_id = 0
+  while True:
+    rows = conn.execute(
+      select(Request.id, Request.info)
+      .where(Request.id > last_id)
+      .order_by(Request.id)
+      .limit(batch_size)
+    ).all()
+    if not rows:
+      break
+
+    conn.execute(
+      update(Request).where(Request.id == bindparam("row_id")),
+      [
+        {
+          "row_id": row.id,
+          "request_type": row.info["type"],
+          "resolved": bool(row.info.get("resolved")),
+        }
+        for row in rows
+      ],
+    )
+    last_id = rows[-1].id
+
+  for index in Request.__table__.indexes:
+    if index.name == "ix_Request_request_type_resolved":
+      index.create(conn, checkfirst=True)
+
+def create_user_profiles(conn: Connection):
+  UserProfile.__table__.create(conn, checkfirst=True)
+
+def create_persistence_tables(conn: Connection):
+  for table in (PersistedUserData, PersistedChatData, PersistedConversation):
+    table.__table__.create(conn, checkfirst=True)
+
+def add_created_at_and_archive_tables(conn: Connection):
+  # the real creation time of existing requests is unknown
+  add_column(conn, Request.__table__.c.created_at, repr(UNKNOWN_CREATED_AT))
+  for table in (ArchivedRequest, ArchivedRequestNotification, ArchivedRequestVerdictNotification):
+    table.__table__.create(conn, checkfirst=True)
+
+def create_parade_state(conn: Connection):
+  ParadeStateCount.__table__.create(conn, checkfirst=True)
+  count_existing_requests(conn)
+
+def index_status_with_id(conn: Connection):
+  for index in Request.__table__.indexes:
+    if index.name == "ix_Request_status_id":
+      index.create(conn, checkfirst=True)
+  # superseded by ix_Request_status_id
+  conn.execute(text('DROP INDEX IF EXISTS "ix_Request_status"'))
+
+MIGRATIONS = [
+  create_indices,
+  promote_request_type_and_resolved,
+  create_user_profiles,
+  create_persistence_tables,
+  add_created_at_and_archive_tables,
+  create_parade_state,
+  create_search_indices,
+  index_status_with_id,
+]
+
+def back_up_sqlite_database(conn: Connection, version: int):
+  database_path = conn.engine.url.database
+  backup_path = f"{database_path}.v{version}-{int(time.time())}.bak"
+  logger.info(f"Backing up database to {backup_path} before migrating")
+  # VACUUM INTO produces a consistent copy even if other connections are open
+  conn.execute(text("VACUUM INTO :backup_path"), {"backup_path": os.path.abspath(backup_path)})
+
+def migrate(engine: Engine):
+  """
+  Creates missing tables and brings the schema of an existing database up to
+  date. New databases are created with the latest schema and need no migrations.
+  """
+  with engine.begin() as conn:
+    is_new_database = not inspect(conn).has_table(Request.__tablename__)
+    version = None if is_new_database or not inspect(conn).has_table(SchemaVersion.__tablename__) \
+              else conn.scalar(select(SchemaVersion.version))
+
+    Base.metadata.create_all(conn)
+
+    if version is None:
+      # databases created before migrations were introduced are at version 0
+      version = len(MIGRATIONS) if is_new_database else 0
+      conn.execute(insert(SchemaVersion).values(version=version))
+
+  if version > len(MIGRATIONS):
+    raise RuntimeError(
+      f"Database schema version {version} is newer than the latest known version "
+      f"{len(MIGRATIONS)}. Was the bot downgraded?"
+    )
+
+  if version < len(MIGRATIONS) and engine.dialect.name == "sqlite" \
+     and engine.url.database not in (None, "", ":memory:"):
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+      back_up_sqlite_database(conn, version)
+
+  for new_version, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+    logger.info(f"Migrating database to schema version {new_version} ({migration.__name__})")
+    with engine.begin() as conn:
+      migration(conn)
+      conn.execute(update(SchemaVersion).values(version=new_version))
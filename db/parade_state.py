@@ -0,0 +1,141 @@
+"""
+Daily parade state: for each day and request type, the number of requests
+that apply to that day (every day of an MC, the day of a BCP clearance, etc.),
+and how many of them were approved or rejected.
+
+The counts in `ParadeStateCount` are changed in the same transaction as the
+requests they count, so `/parade` can answer from them without scanning
+requests. Status changes are counted from the rows that a conditional update
+actually changed, never from a status read earlier, so concurrent changes to
+one request are counted once. Each change is one upsert covering all of the
+request's days, or of all the requests changed together.
+"""
+
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Connection, select, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utility.constants import RequestStatus, PARADE_STATE_DAY_FIELDS
+from utility.summarize_request import decode_field
+from .classes import Request, ArchivedRequest, ParadeStateCount
+
+COUNT_COLUMNS = ("submitted", "approved", "rejected")
+
+# dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {
+  "sqlite": sqlite.insert,
+  "postgresql": postgresql.insert,
+}
+
+def get_parade_days(request_type: str, info: dict) -> List[date]:
+  """Days that a request applies to, from the timestamps in its `info`."""
+  if request_type not in PARADE_STATE_DAY_FIELDS:
+    return []
+
+  first_day, last_day = (
+    decode_field(field_name, info[field_name]) for field_name in PARADE_STATE_DAY_FIELDS[request_type]
+  )
+  # report sick times are datetimes
+  if isinstance(first_day, datetime):
+    first_day, last_day = first_day.date(), last_day.date()
+  return [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+
+def get_verdict_column(status: RequestStatus) -> Optional[str]:
+  if status == RequestStatus.APPROVED:
+    return "approved"
+  elif status == RequestStatus.REJECTED:
+    return "rejected"
+  return None
+
+async def add_counts(db_session: AsyncSession, changes: Dict[Tuple[date, str], Counter]):
+  """Adds `changes`, the changes to each column by day and request type, to the counts in one upsert."""
+  changes = {key: column_changes for key, column_changes in changes.items() if any(column_changes.values())}
+  if not changes:
+    return
+
+  statement = UPSERT_INSERTS[db_session.bind.dialect.name](ParadeStateCount).values([
+    {
+      "day": day,
+      "request_type": request_type,
+      **{column: column_changes[column] for column in COUNT_COLUMNS},
+    }
+    for (day, request_type), column_changes in changes.items()
+  ])
+  statement = statement.on_conflict_do_update(
+    index_elements=[ParadeStateCount.day, ParadeStateCount.request_type],
+    set_={
+      column: getattr(ParadeStateCount, column) + getattr(statement.excluded, column)
+      for column in COUNT_COLUMNS
+    },
+  )
+  await db_session.execute(statement)
+
+async def record_submission(db_session: AsyncSession, request_type: str, info: dict):
+  await add_counts(db_session, {
+    (day, request_type): Counter(submitted=1) for day in get_parade_days(request_type, info)
+  })
+
+async def record_status_changes(db_session: AsyncSession, changes: List[Tuple[str, dict, RequestStatus, RequestStatus]]):
+  """
+  Records status changes, given as (request type, info, old status, new
+  status), in one upsert. Only changes that an update conditional on the old
+  status has made may be given (see `db.request_repository.change_statuses_if_unchanged`),
+  in the same transaction, since a status read earlier may be stale.
+  """
+  counts = defaultdict(Counter)
+  for request_type, info, old_status, new_status in changes:
+    old_column = get_verdict_column(old_status)
+    new_column = get_verdict_column(new_status)
+    if old_column == new_column:
+      continue
+
+    for day in get_parade_days(request_type, info):
+      if old_column is not None:
+        counts[(day, request_type)][old_column] -= 1
+      if new_column is not None:
+        counts[(day, request_type)][new_column] += 1
+  await add_counts(db_session, counts)
+
+async def get_parade_state(db_session: AsyncSession, day: date) -> List[ParadeStateCount]:
+  return (await db_session.scalars(
+    select(ParadeStateCount).where(ParadeStateCount.day == day, ParadeStateCount.submitted > 0)
+  )).all()
+
+def count_existing_requests(conn: Connection, batch_size: int = 1000):
+  """Fills `ParadeStateCount` from all requests, for databases made before it existed."""
+  counts = Counter()
+  for table in (Request, ArchivedRequest):
+    last_id = 0
+    while True:
+      rows = conn.execute(
+        select(table.id, table.request_type, table.info, table.status)
+        .where(table.id > last_id, table.request_type.in_(PARADE_STATE_DAY_FIELDS))
+        .order_by(table.id)
+        .limit(batch_size)
+      ).all()
+      if not rows:
+        break
+
+      for row in rows:
+        verdict_column = get_verdict_column(row.status)
+        for day in get_parade_days(row.request_type, row.info):
+          counts[(day, row.request_type, "submitted")] += 1
+          if verdict_column is not None:
+            counts[(day, row.request_type, verdict_column)] += 1
+      last_id = rows[-1].id
+
+  keys = {(day, request_type) for day, request_type, _ in counts}
+  if keys:
+    conn.execute(insert(ParadeStateCount), [
+      {
+        "day": day,
+        "request_type": request_type,
+        "submitted": counts[(day, request_type, "submitted")],
+        "approved": counts[(day, request_type, "approved")],
+        "rejected": counts[(day, request_type, "rejected")],
+      }
+      for day, request_type in keys
+    ])
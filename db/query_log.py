@@ -0,0 +1,91 @@
+"""
+Statement instrumentation for the engines, in place of `echo=True`.
+
+Every statement executed is timed. Statements slower than the slow query
+threshold are logged as warnings, and a random sample of the rest (none by
+default) is logged at INFO level. Statements are also counted against the
+update being handled, if any (see `internal.update_processor`), so that N+1
+query patterns show up as updates running unusually many statements.
+Other modules can observe statement timings through `statement_observers`.
+"""
+
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from sqlalchemy import Engine, event
+
+DEFAULT_SLOW_QUERY_THRESHOLD = 0.25
+DEFAULT_SAMPLE_RATE = 0
+DEFAULT_UPDATE_STATEMENT_THRESHOLD = 20
+
+logger = logging.getLogger(__name__)
+
+_slow_query_threshold = DEFAULT_SLOW_QUERY_THRESHOLD
+_sample_rate = DEFAULT_SAMPLE_RATE
+_update_statement_threshold = DEFAULT_UPDATE_STATEMENT_THRESHOLD
+
+# called with (statement, duration in seconds) after every statement
+statement_observers: List[Callable[[str, float], None]] = []
+
+class StatementStats:
+  __slots__ = ("count", "duration")
+
+  def __init__(self):
+    self.count = 0
+    self.duration = 0.0
+
+# stats of the update being handled in the current context
+current_statement_stats: ContextVar[Optional[StatementStats]] = ContextVar("current_statement_stats", default=None)
+
+def configure_query_log(
+  slow_query_threshold: float = DEFAULT_SLOW_QUERY_THRESHOLD,
+  sample_rate: float = DEFAULT_SAMPLE_RATE,
+  update_statement_threshold: int = DEFAULT_UPDATE_STATEMENT_THRESHOLD,
+):
+  """
+  `slow_query_threshold` is in seconds. `sample_rate` is the fraction of
+  statements and updates that are logged regardless. Updates that run more
+  than `update_statement_threshold` statements are logged as warnings.
+  """
+  global _slow_query_threshold, _sample_rate, _update_statement_threshold
+  _slow_query_threshold = slow_query_threshold
+  _sample_rate = sample_rate
+  _update_statement_threshold = update_statement_threshold
+
+# the start time is kept on the execution context, which is discarded along
+# with it if the statement fails
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  context.statement_start_time = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  duration = time.perf_counter() - context.statement_start_time
+
+  stats = current_statement_stats.get()
+  if stats is not None:
+    stats.count += 1
+    stats.duration += duration
+
+  # parameters are left out because they contain trainees' personal details
+  if duration >= _slow_query_threshold:
+    logger.warning(f"Slow query ({duration * 1000:.1f} ms): {statement}")
+  elif _sample_rate and random.random() < _sample_rate:
+    logger.info(f"Sampled query ({duration * 1000:.1f} ms): {statement}")
+
+  for observer in statement_observers:
+    observer(statement, duration)
+
+def log_update_statements(update_description: str, stats: StatementStats):
+  message = f"{update_description} ran {stats.count} statements in {stats.duration * 1000:.1f} ms"
+  if stats.count > _update_statement_threshold:
+    logger.warning(f"{message}. Is there a query in a loop?")
+  elif _sample_rate and random.random() < _sample_rate:
+    logger.info(message)
+
+def log_queries(engine: Engine):
+  """Instruments `engine`. For an AsyncEngine, pass its `sync_engine`."""
+  if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
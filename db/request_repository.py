@@ -0,0 +1,206 @@
+"""
+Queries for looking up requests, shared by the handlers.
+
+Statements are built once at import time with bound parameters, so each call
+only binds values and reuses the compiled SQL from SQLAlchemy's statement
+cache. A request is loaded together with its notifications and verdict
+notification in a single statement, since lazy loading is unavailable in an
+async session and would otherwise cost extra round-trips.
+
+Lookups by reference no. that only read fall back to the archive tables (see
+`db.archive`), so they keep working for old requests. The archive is queried
+only for IDs no higher than the highest archived ID, which the first statement
+also returns, so lookups of current requests and of nonexistent reference nos.
+above it still take one statement.
+
+Open requests are paged by keyset on (status, ID) in the order of
+`OPEN_REQUEST_STATUSES`: each page continues from the key of the last request
+on the previous one, with an index seek per status on `ix_Request_status_id`,
+so every page costs the same however many requests are open.
+"""
+
+from collections import defaultdict
+from typing import List, NamedTuple, Optional, Tuple, Union
+from sqlalchemy import select, update, bindparam, func, and_
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from utility.constants import RequestStatus, OPEN_REQUEST_STATUSES
+from .classes import Request, ArchivedRequest
+from .parade_state import record_status_changes
+
+SELECT_REQUEST = select(Request) \
+  .where(Request.id == bindparam("request_id")) \
+  .options(joinedload(Request.notifications), joinedload(Request.verdict_notification))
+
+# the requests stay locked until the end of the transaction, where the
+# database supports it, so that concurrent button presses wait for it
+SELECT_REQUESTS_FOR_UPDATE = select(Request) \
+  .where(Request.id.in_(bindparam("request_ids", expanding=True))) \
+  .options(joinedload(Request.notifications), joinedload(Request.verdict_notification)) \
+  .with_for_update(of=Request)
+
+# a single row holding the highest archived ID, or NULL if none are archived
+ARCHIVED_HIGH_WATER_MARK = select(func.max(ArchivedRequest.id).label("max_id")).subquery()
+
+# outer joined to the high-water mark, so that a row is returned even if the request is not found
+SELECT_REQUEST_OF_TYPE = select(Request, ARCHIVED_HIGH_WATER_MARK.c.max_id) \
+  .select_from(ARCHIVED_HIGH_WATER_MARK) \
+  .outerjoin(Request, and_(Request.id == bindparam("request_id"), Request.request_type == bindparam("request_type")))
+
+SELECT_SENDER_ID = select(Request.sender_id, ARCHIVED_HIGH_WATER_MARK.c.max_id) \
+  .select_from(ARCHIVED_HIGH_WATER_MARK) \
+  .outerjoin(Request, Request.id == bindparam("request_id"))
+
+SELECT_ARCHIVED_REQUEST_OF_TYPE = select(ArchivedRequest) \
+  .where(ArchivedRequest.id == bindparam("request_id"), ArchivedRequest.request_type == bindparam("request_type"))
+
+SELECT_ARCHIVED_SENDER_ID = select(ArchivedRequest.sender_id).where(ArchivedRequest.id == bindparam("request_id"))
+
+SELECT_OPEN_REQUESTS = select(Request.id, Request.request_type, Request.status, Request.info, Request.created_at) \
+  .where(Request.status == bindparam("status")) \
+  .limit(bindparam("limit"))
+
+SELECT_OPEN_REQUESTS_AFTER = SELECT_OPEN_REQUESTS \
+  .where(Request.id > bindparam("request_id")) \
+  .order_by(Request.id)
+
+SELECT_OPEN_REQUESTS_BEFORE = SELECT_OPEN_REQUESTS \
+  .where(Request.id < bindparam("request_id")) \
+  .order_by(Request.id.desc())
+
+SELECT_LAST_OPEN_REQUESTS = SELECT_OPEN_REQUESTS.order_by(Request.id.desc())
+
+# (status, request ID)
+RequestKey = Tuple[RequestStatus, int]
+
+class OpenRequestsPage(NamedTuple):
+  # rows with id, request_type, status, info and created_at
+  requests: list
+  has_previous: bool
+  has_next: bool
+
+async def get_request(db_session: AsyncSession, request_id: int) -> Optional[Request]:
+  """Returns the request with its `notifications` and `verdict_notification` loaded, or None."""
+  result = await db_session.scalars(SELECT_REQUEST, {"request_id": request_id})
+  # joined rows repeat the request once per notification
+  return result.unique().one_or_none()
+
+async def get_requests_for_update(db_session: AsyncSession, request_ids: List[int]) -> List[Request]:
+  """Like `get_request` for each of `request_ids` that exists, in no particular order. Must be called in a transaction."""
+  result = await db_session.scalars(SELECT_REQUESTS_FOR_UPDATE, {"request_ids": request_ids})
+  return result.unique().all()
+
+async def change_statuses_if_unchanged(
+  db_session: AsyncSession,
+  requests: List[Request],
+  new_status: RequestStatus,
+) -> List[Request]:
+  """
+  Sets the status of each of `requests` unless it has changed in the database
+  since the request was loaded (rows are not locked on SQLite), and records
+  the changes returned by the update in the parade state. Returns the
+  requests whose status was set.
+  Takes one statement per distinct old status, plus one for the parade state.
+  """
+  requests_by_status = defaultdict(list)
+  for request in requests:
+    requests_by_status[request.status].append(request)
+
+  changed = []
+  changes = []
+  for old_status, status_requests in requests_by_status.items():
+    changed_rows = (await db_session.execute(
+      update(Request)
+      .where(Request.id.in_([request.id for request in status_requests]), Request.status == old_status)
+      .values(status=new_status)
+      .returning(Request.id, Request.request_type, Request.info)
+      .execution_options(synchronize_session=False)
+    )).all()
+    changed_ids = {row.id for row in changed_rows}
+    for request in status_requests:
+      if request.id in changed_ids:
+        set_committed_value(request, "status", new_status)
+        changed.append(request)
+    changes += [(row.request_type, row.info, old_status, new_status) for row in changed_rows]
+
+  await record_status_changes(db_session, changes)
+  return changed
+
+async def get_request_of_type(
+  db_session: AsyncSession,
+  request_id: int,
+  request_type: str,
+) -> Union[Request, ArchivedRequest, None]:
+  """
+  Returns the request if it is of `request_type`, without its notifications, or None.
+  Archived requests are finished, and are returned as an `ArchivedRequest`.
+  """
+  parameters = {"request_id": request_id, "request_type": request_type}
+  request, archived_max_id = (await db_session.execute(SELECT_REQUEST_OF_TYPE, parameters)).one()
+  if request is None and archived_max_id is not None and request_id <= archived_max_id:
+    request = await db_session.scalar(SELECT_ARCHIVED_REQUEST_OF_TYPE, parameters)
+  return request
+
+async def get_sender_id(db_session: AsyncSession, request_id: int) -> Optional[int]:
+  sender_id, archived_max_id = (await db_session.execute(SELECT_SENDER_ID, {"request_id": request_id})).one()
+  if sender_id is None and archived_max_id is not None and request_id <= archived_max_id:
+    sender_id = await db_session.scalar(SELECT_ARCHIVED_SENDER_ID, {"request_id": request_id})
+  return sender_id
+
+async def get_open_requests_after(db_session: AsyncSession, key: Optional[RequestKey], limit: int) -> list:
+  """Returns up to `limit` open requests following `key` in keyset order, or the first ones if `key` is None."""
+  status_index, request_id = (OPEN_REQUEST_STATUSES.index(key[0]), key[1]) if key else (0, 0)
+  requests = []
+  for status in OPEN_REQUEST_STATUSES[status_index:]:
+    requests += (await db_session.execute(
+      SELECT_OPEN_REQUESTS_AFTER,
+      {"status": status, "request_id": request_id, "limit": limit - len(requests)},
+    )).all()
+    if len(requests) == limit:
+      break
+    request_id = 0
+  return requests
+
+async def get_open_requests_before(db_session: AsyncSession, key: RequestKey, limit: int) -> list:
+  """Returns up to `limit` open requests preceding `key`, nearest first."""
+  status_index = OPEN_REQUEST_STATUSES.index(key[0])
+  requests = (await db_session.execute(
+    SELECT_OPEN_REQUESTS_BEFORE,
+    {"status": key[0], "request_id": key[1], "limit": limit},
+  )).all()
+  for status in reversed(OPEN_REQUEST_STATUSES[:status_index]):
+    if len(requests) == limit:
+      break
+    requests += (await db_session.execute(
+      SELECT_LAST_OPEN_REQUESTS,
+      {"status": status, "limit": limit - len(requests)},
+    )).all()
+  return requests
+
+async def get_open_requests_page(
+  db_session: AsyncSession,
+  page_size: int,
+  after: Optional[RequestKey] = None,
+  before: Optional[RequestKey] = None,
+) -> OpenRequestsPage:
+  """
+  Returns the page of open requests following `after`, or preceding `before`.
+  The first page is returned if neither is given, if fewer than a page of
+  requests precede `before`, or if none follow `after` (e.g. because they have
+  since been closed).
+  """
+  if before is not None:
+    # one extra request shows whether there is a page before this one
+    requests = await get_open_requests_before(db_session, before, page_size + 1)
+    if len(requests) > page_size:
+      return OpenRequestsPage(list(reversed(requests[:page_size])), has_previous=True, has_next=True)
+    after = None
+
+  requests = await get_open_requests_after(db_session, after, page_size + 1)
+  if not requests and after is not None:
+    # the requests after `after` have all been closed since
+    after = None
+    requests = await get_open_requests_after(db_session, after, page_size + 1)
+  return OpenRequestsPage(requests[:page_size], has_previous=after is not None, has_next=len(requests) > page_size)
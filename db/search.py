@@ -0,0 +1,153 @@
+"""
+Full-text search over the contents of requests, using SQLite's FTS5.
+
+The text fields of `Request.info` (rank/name, course, location, vehicle
+number, reason and enquiry) and the request type are indexed in the FTS5
+table `RequestSearch`, and those of archived requests in
+`ArchivedRequestSearch`. Triggers keep each index in step with its table, so
+every way of writing requests, including archival and raw SQL, keeps the
+indices current. The rowid of an index entry is the request's ID.
+
+Ranking scores every matching entry, which is slow for terms found in much
+of a large index. Only the most recent `RANKED_MATCH_LIMIT` matches of each
+index are therefore ranked, by restricting the search to rowids from the
+oldest of them, which FTS5 finds by walking its doclists from the end.
+Prefix queries merge the doclists of every word with the prefix before they
+can do that, so terms are first matched as whole words, and as prefixes (for
+partial vehicle numbers and names) only if no request matches them all.
+
+Other databases have no FTS5, so search is only available with SQLite.
+"""
+
+import html
+from typing import List, NamedTuple
+from sqlalchemy import Connection, DDL, event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .classes import Request, ArchivedRequest
+
+SEARCH_FIELD_NAMES = ("rank_name", "course", "location", "vehicle_number", "reason", "enquiry")
+
+# request table name -> index table name
+SEARCH_TABLES = {
+  Request.__tablename__: "RequestSearch",
+  ArchivedRequest.__tablename__: "ArchivedRequestSearch",
+}
+
+RANKED_MATCH_LIMIT = 5000
+
+# marks matched terms in snippets, replaced after the rest is escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+class SearchResult(NamedTuple):
+  id: int
+  request_type: str
+  rank_name: str
+  # HTML, with matched terms in bold
+  snippet: str
+  score: float
+  is_archived: bool
+
+def get_search_ddl(table_name: str) -> List[str]:
+  search_table_name = SEARCH_TABLES[table_name]
+  columns = ", ".join(("request_type",) + SEARCH_FIELD_NAMES)
+  values = ", ".join(
+    ("new.request_type",) + tuple(f"json_extract(new.info, '$.{field_name}')" for field_name in SEARCH_FIELD_NAMES)
+  )
+  insert_entry = f'INSERT INTO "{search_table_name}" (rowid, {columns}) VALUES (new.id, {values});'
+  delete_entry = f'DELETE FROM "{search_table_name}" WHERE rowid = old.id;'
+
+  return [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS "{search_table_name}" USING fts5({columns})',
+    f'CREATE TRIGGER IF NOT EXISTS "{search_table_name}_insert" AFTER INSERT ON "{table_name}" '
+    f'BEGIN {insert_entry} END',
+    f'CREATE TRIGGER IF NOT EXISTS "{search_table_name}_delete" AFTER DELETE ON "{table_name}" '
+    f'BEGIN {delete_entry} END',
+    f'CREATE TRIGGER IF NOT EXISTS "{search_table_name}_update" AFTER UPDATE OF request_type, info ON "{table_name}" '
+    f'BEGIN {delete_entry} {insert_entry} END',
+  ]
+
+def create_search_indices(conn: Connection):
+  """Creates the indices and their triggers, and indexes existing requests."""
+  if conn.dialect.name != "sqlite":
+    return
+
+  for table_name, search_table_name in SEARCH_TABLES.items():
+    for statement in get_search_ddl(table_name):
+      conn.execute(text(statement))
+    conn.execute(text(f'DELETE FROM "{search_table_name}"'))
+    conn.execute(text(
+      f'INSERT INTO "{search_table_name}" (rowid, {", ".join(("request_type",) + SEARCH_FIELD_NAMES)}) '
+      f'SELECT id, request_type, ' +
+      ", ".join(f"json_extract(info, '$.{field_name}')" for field_name in SEARCH_FIELD_NAMES) +
+      f' FROM "{table_name}"'
+    ))
+
+# new databases get the indices along with the tables
+for table in (Request.__table__, ArchivedRequest.__table__):
+  for statement in get_search_ddl(table.name):
+    event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+def make_match_query(terms: List[str], prefix: bool = False) -> str:
+  # each term is quoted so that FTS5 syntax in it is matched literally
+  return " ".join('"' + term.replace('"', '""') + '"' + ("*" if prefix else "") for term in terms)
+
+def format_snippet(snippet: str) -> str:
+  return html.escape(snippet or "").replace(MATCH_START, "<b>").replace(MATCH_END, "</b>")
+
+def is_search_available(db_session: AsyncSession) -> bool:
+  return db_session.bind.dialect.name == "sqlite"
+
+async def find_ranked_matches(db_session: AsyncSession, search_table_name: str, query: str):
+  """Returns the oldest of the most recent `RANKED_MATCH_LIMIT` matches of `query`, and how many there are."""
+  return (await db_session.execute(
+    text(
+      f'SELECT min(rowid) AS oldest_ranked_id, count(*) AS match_count FROM ('
+      f'SELECT rowid FROM "{search_table_name}" WHERE "{search_table_name}" MATCH :query '
+      f'ORDER BY rowid DESC LIMIT :limit)'
+    ),
+    {"query": query, "limit": RANKED_MATCH_LIMIT},
+  )).one()
+
+async def search_requests(db_session: AsyncSession, terms: List[str], limit: int = 10) -> List[SearchResult]:
+  """Returns the requests best matching all of `terms`, current and archived, best match first."""
+  for query in (make_match_query(terms), make_match_query(terms, prefix=True)):
+    matches = {
+      table_name: await find_ranked_matches(db_session, search_table_name, query)
+      for table_name, search_table_name in SEARCH_TABLES.items()
+    }
+    if any(match.match_count for match in matches.values()):
+      break
+  else:
+    return []
+
+  results = []
+  for table_name, search_table_name in SEARCH_TABLES.items():
+    if not matches[table_name].match_count:
+      continue
+    rows = await db_session.execute(
+      text(
+        f'SELECT rowid, request_type, rank_name, '
+        f"snippet(\"{search_table_name}\", -1, '{MATCH_START}', '{MATCH_END}', '…', 8) AS snippet, "
+        f'bm25("{search_table_name}") AS score '
+        f'FROM "{search_table_name}" WHERE "{search_table_name}" MATCH :query AND rowid >= :oldest_ranked_id '
+        f'ORDER BY score LIMIT :limit'
+      ),
+      {"query": query, "oldest_ranked_id": matches[table_name].oldest_ranked_id, "limit": limit},
+    )
+    results.extend(
+      SearchResult(
+        id=row.rowid,
+        request_type=row.request_type,
+        rank_name=row.rank_name,
+        snippet=format_snippet(row.snippet),
+        score=row.score,
+        is_archived=table_name == ArchivedRequest.__tablename__,
+      )
+      for row in rows
+    )
+
+  # lower BM25 scores are better matches
+  results.sort(key=lambda result: result.score)
+  return results[:limit]
@@ -1 +1 @@
-from features import shared, bcp, report_sick, mc, ippt, sdo, enquiry, send_message_to_requestor
+from features import shared, bcp, report_sick, mc, ippt, sdo, enquiry, send_message_to_requestor, export, parade_state, search, pending, bulk_approve
@@ -116,6 +116,9 @@ async def bcp_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def add_handlers(app: Application):
   app.add_handler(ConversationHandler(
+    name="bcp",
+    persistent=True,
+
     entry_points=[
       CommandHandler(
         command="bcp",
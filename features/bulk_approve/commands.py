@@ -0,0 +1,145 @@
+from telegram import Update
+from telegram.ext import filters, Application, CommandHandler, ContextTypes
+from functools import partial
+from typing import List
+import logging
+
+from utility.fan_out import fan_out
+from utility.bot_config import get_bot_config
+from utility.constants import RequestStatus, OPEN_REQUEST_STATUSES, REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL, \
+                              DEFAULT_MAX_CONCURRENT_NOTIFICATIONS
+from features.shared.callbacks import edit_notification_keyboards, get_approval_type, make_approved_keyboard
+
+from sqlalchemy import insert
+from db import AsyncDBSession, ReadOnlyDBSession
+from db.classes import ChatGroup, Request, RequestVerdictNotification
+from db.request_repository import get_requests_for_update, change_statuses_if_unchanged
+
+# Approves many requests at once, e.g. /approve 101-130,142.
+# All status changes are made in one transaction, each only if the request
+# is still in the status it was read in. The trainees are then
+# notified concurrently through fan_out, with every call rate-limited by the
+# outbound scheduler, and the notification keyboards are updated through the
+# coalesced keyboard edit queue. Requests whose trainee could not be notified
+# are returned to their previous status, since undoing an approval needs the
+# verdict message.
+
+MAX_BULK_APPROVE_REQUESTS = 100
+
+logger = logging.getLogger(__name__)
+
+def parse_request_ids(text: str) -> List[int]:
+  """Parses comma-separated reference nos. and inclusive ranges of them, e.g. "101-130,142"."""
+  ranges = []
+  for part in text.replace(" ", "").split(","):
+    if not part:
+      continue
+    first, _, last = part.partition("-")
+    first, last = int(first), int(last or first)
+    assert 0 < first <= last, f"Invalid range {part}"
+    ranges.append((first, last))
+
+  # checked before expanding the ranges, which may be huge
+  assert sum(last - first + 1 for first, last in ranges) <= MAX_BULK_APPROVE_REQUESTS, "Too many requests"
+  return list(dict.fromkeys(request_id for first, last in ranges for request_id in range(first, last + 1)))
+
+def can_approve(request: Request) -> bool:
+  if request.status not in OPEN_REQUEST_STATUSES:
+    return False
+  # the approving party must have been informed, as with the buttons
+  return not REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request.request_type] or \
+         request.status not in (RequestStatus.PENDING_ACKNOWLEDGEMENT, RequestStatus.ACKNOWLEDGED)
+
+def describe_ids(request_ids) -> str:
+  return ", ".join(str(request_id) for request_id in sorted(request_ids))
+
+async def bulk_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  try:
+    request_ids = parse_request_ids(",".join(context.args))
+    assert request_ids, "No requests given"
+  except:
+    await update.message.reply_text(
+      text="Syntax error.\n"
+           f"To approve up to {MAX_BULK_APPROVE_REQUESTS} requests at once, use:\n"
+           "<code>/approve [reference nos. or ranges]</code>\n"
+           "E.g. <code>/approve 101-130,142</code>",
+      parse_mode="HTML",
+    )
+    return
+
+  async with ReadOnlyDBSession() as db_session:
+    if await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      return
+
+  async with AsyncDBSession() as db_session:
+    async with db_session.begin():
+      requests = await get_requests_for_update(db_session, request_ids)
+      old_statuses = {request.id: request.status for request in requests}
+      # approve() and reject() claim their verdict the same way, so only one
+      # verdict is given and stored for each request
+      approved = await change_statuses_if_unchanged(
+        db_session,
+        [request for request in requests if can_approve(request)],
+        RequestStatus.APPROVED,
+      )
+
+    sent_messages = await fan_out(
+      (
+        partial(
+          context.bot.send_message,
+          request.sender_id,
+          text=f"Your {request.request_type} (ref. {request.id}) has been {get_approval_type(request.request_type)}.",
+        )
+        for request in approved
+      ),
+      max_concurrency=get_bot_config().get(
+        "max_concurrent_notifications",
+        DEFAULT_MAX_CONCURRENT_NOTIFICATIONS,
+      ),
+    )
+
+    notified = []
+    unnotified = []
+    for request, sent_message in zip(approved, sent_messages):
+      if isinstance(sent_message, BaseException):
+        logger.error(f"Failed to notify user ID {request.sender_id} of approval of request {request.id}: {sent_message!r}")
+        unnotified.append(request)
+      else:
+        notified.append((request, sent_message))
+
+    async with db_session.begin():
+      if notified:
+        await db_session.execute(insert(RequestVerdictNotification), [
+          {"chat_id": request.sender_id, "message_id": sent_message.id, "request_id": request.id}
+          for request, sent_message in notified
+        ])
+      # each to its previous status, unless it was changed in the meantime
+      for old_status in set(old_statuses[request.id] for request in unnotified):
+        await change_statuses_if_unchanged(
+          db_session,
+          [request for request in unnotified if old_statuses[request.id] == old_status],
+          old_status,
+        )
+
+  for request, _ in notified:
+    edit_notification_keyboards(context, request, make_approved_keyboard(request, update.effective_user.username))
+
+  found_ids = {request.id for request in requests}
+  approved_ids = {request.id for request, _ in notified}
+  lines = [f"Approved {len(approved_ids)} request(s)" + (f": {describe_ids(approved_ids)}" if approved_ids else ".")]
+  if unnotified:
+    lines.append(f"Not approved, as the requester could not be notified: {describe_ids(request.id for request in unnotified)}")
+  skipped_ids = found_ids - approved_ids - {request.id for request in unnotified}
+  if skipped_ids:
+    lines.append(f"Skipped, as already decided or the approving party was not yet informed: {describe_ids(skipped_ids)}")
+  missing_ids = set(request_ids) - found_ids
+  if missing_ids:
+    lines.append(f"Not found or archived: {describe_ids(missing_ids)}")
+  await update.message.reply_text("\n".join(lines))
+
+def add_handlers(app: Application):
+  app.add_handler(CommandHandler(
+    command="approve",
+    callback=bulk_approve,
+    filters=filters.ChatType.GROUPS,
+  ))
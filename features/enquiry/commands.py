@@ -7,10 +7,8 @@ from utility.summarize_request import summarize_request
 from utility.string_casing import uppercase_first_letter
 from utility.constants import EnquiryConversationState, PRIVATE_MESSAGE_FILTER
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session as DBSession
-from db import engine
-from db.classes import Request
+from db import AsyncDBSession
+from db.request_repository import get_request_of_type
 
 REQUEST_TYPE = "enquiry"
 
@@ -92,22 +90,19 @@ async def resolve_enquiry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return
   
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(
-      select(Request).where(Request.id == request_id)
-    )
+  async with AsyncDBSession() as db_session:
+    request = await get_request_of_type(db_session, request_id, REQUEST_TYPE)
 
-    if not request or request.info["type"] != "enquiry":
+    if not request:
       await update.message.reply_text(f"No enquiry with reference no. {request_id}.")
       return
     
-    if "resolved" in request.info and request.info["resolved"]:
+    if request.resolved:
       await update.message.reply_text(f"Enquiry already resolved.")
       return
     
-    request.info["resolved"] = True
-    db_session.add(request)
-    db_session.commit()
+    request.resolved = True
+    await db_session.commit()
 
     await update.message.reply_text("Enquiry marked as resolved. User has been notified.")
     await context.bot.send_message(
@@ -117,6 +112,9 @@ async def resolve_enquiry(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def add_handlers(app: Application):
   app.add_handler(ConversationHandler(
+    name="enquiry",
+    persistent=True,
+
     entry_points=[
       CommandHandler(
         command="enquiry",
@@ -0,0 +1,161 @@
+from telegram import Update
+from telegram.ext import filters, Application, CommandHandler, ContextTypes
+from datetime import datetime, timedelta, timezone
+import csv
+import io
+import tempfile
+
+from utility.summarize_request import stringify_field, decode_field
+from utility.constants import FIELD_NAME_MAPPINGS
+
+from sqlalchemy import select, func
+from db import ReadOnlyDBSession
+from db.classes import Request, ArchivedRequest, ChatGroup, UNKNOWN_CREATED_AT
+
+# Exports requests of one type submitted in a date range as CSV.
+# Rows are streamed from a server-side cursor in batches and written straight
+# to temporary files, so memory use does not grow with the size of the export.
+# The bot uploads a document from memory, so large exports are split into
+# parts of at most EXPORT_PART_SIZE bytes, each uploaded separately and well
+# under the Bot API's 50 MB limit.
+# Requests made before submission times were recorded cannot be placed in a
+# date range, so they are left out and their number is given in the reply.
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_PART_SIZE = 20 * 1024 * 1024
+# seconds allowed for uploading one part
+EXPORT_UPLOAD_TIMEOUT = 120
+
+# request types by the command used to submit them
+EXPORT_REQUEST_TYPES = {
+  "bcp": "BCP clearance request",
+  "reportsick": "report sick notification",
+  "ippt": "IPPT booking request",
+  "mc": "MC notification",
+  "enquiry": "enquiry",
+}
+
+def select_export_rows(table, request_type: str, start_time: float, end_time: float):
+  return select(table.id, table.created_at, table.sender_id, table.status, table.resolved, table.info) \
+    .where(table.request_type == request_type, table.created_at >= start_time, table.created_at < end_time) \
+    .order_by(table.id) \
+    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def open_export_part():
+  part = tempfile.TemporaryFile()
+  # the BOM lets spreadsheet programs detect UTF-8
+  text = io.TextIOWrapper(part, encoding="utf-8-sig", newline="")
+  return part, text
+
+async def write_export(request_type: str, start_time: float, end_time: float):
+  """Returns the parts of the export as binary files positioned at the start, and the number of rows."""
+  field_names = list(FIELD_NAME_MAPPINGS[request_type])
+  header = ["Reference no.", "Submitted at", "Sender ID", "Status"] + \
+           (["Resolved"] if request_type == "enquiry" else []) + \
+           [FIELD_NAME_MAPPINGS[request_type][field_name] for field_name in field_names]
+
+  parts = []
+  row_count = 0
+  part, text = open_export_part()
+  writer = csv.writer(text)
+  writer.writerow(header)
+
+  async with ReadOnlyDBSession() as db_session:
+    # archived requests are older, so the export stays in order of reference no.
+    for table in (ArchivedRequest, Request):
+      result = await db_session.stream(select_export_rows(table, request_type, start_time, end_time))
+      async for rows in result.partitions():
+        text.flush()
+        if part.tell() >= EXPORT_PART_SIZE:
+          text.detach()
+          parts.append(part)
+          part, text = open_export_part()
+          writer = csv.writer(text)
+          writer.writerow(header)
+
+        for row in rows:
+          writer.writerow(
+            [
+              row.id,
+              stringify_field(datetime.fromtimestamp(row.created_at, tz=timezone(timedelta(hours=8)))),
+              row.sender_id,
+              row.status.name,
+            ] +
+            (["Yes" if row.resolved else "No"] if request_type == "enquiry" else []) +
+            [
+              stringify_field(decode_field(field_name, row.info[field_name])).lstrip("\n")
+              if field_name in row.info else ""
+              for field_name in field_names
+            ]
+          )
+        row_count += len(rows)
+
+  text.detach()
+  parts.append(part)
+  for part in parts:
+    part.seek(0)
+  return parts, row_count
+
+async def count_undated_requests(request_type: str) -> int:
+  async with ReadOnlyDBSession() as db_session:
+    return sum([
+      await db_session.scalar(
+        select(func.count())
+        .select_from(table)
+        .where(table.request_type == request_type, table.created_at == UNKNOWN_CREATED_AT)
+      )
+      for table in (Request, ArchivedRequest)
+    ])
+
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  async with ReadOnlyDBSession() as db_session:
+    if await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      return
+
+  try:
+    start_date_text, end_date_text = context.args[0].split("-")
+    start_date = datetime.strptime(start_date_text, "%d%m%y").replace(tzinfo=timezone(timedelta(hours=8)))
+    end_date = datetime.strptime(end_date_text, "%d%m%y").replace(tzinfo=timezone(timedelta(hours=8)))
+    assert start_date <= end_date, "Start date cannot be after end date"
+    request_type = EXPORT_REQUEST_TYPES[context.args[1].lower()]
+  except:
+    await update.message.reply_text(
+      text="Syntax error.\n"
+           "To export requests submitted between two dates (inclusive) as CSV, use:\n"
+           "<code>/export [DDMMYY]-[DDMMYY] [request type]</code>\n"
+           f"Request types: {', '.join(EXPORT_REQUEST_TYPES)}",
+      parse_mode="HTML",
+    )
+    return
+
+  # the end date is included
+  parts, row_count = await write_export(request_type, start_date.timestamp(), (end_date + timedelta(days=1)).timestamp())
+  undated_count = await count_undated_requests(request_type)
+  undated_note = f"\n{undated_count} {request_type}(s) made before submission times were recorded " \
+                 "cannot be dated and are not included." if undated_count else ""
+  if row_count == 0:
+    for part in parts:
+      part.close()
+    await update.message.reply_text(f"No {request_type}s were submitted between those dates.{undated_note}")
+    return
+
+  file_name = f"{context.args[1].lower()}-{context.args[0]}"
+  try:
+    for part_number, part in enumerate(parts, start=1):
+      await context.bot.send_document(
+        chat_id=update.effective_chat.id,
+        document=part,
+        filename=f"{file_name}.csv" if len(parts) == 1 else f"{file_name}-part{part_number}.csv",
+        caption=f"{row_count} {request_type}(s){undated_note}" if part_number == 1 else None,
+        write_timeout=EXPORT_UPLOAD_TIMEOUT,
+      )
+  finally:
+    for part in parts:
+      part.close()
+
+def add_handlers(app: Application):
+  app.add_handler(CommandHandler(
+    command="export",
+    callback=export,
+    filters=filters.ChatType.GROUPS,
+  ))
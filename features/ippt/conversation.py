@@ -91,6 +91,9 @@ async def ippt_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def add_handlers(app: Application):
   app.add_handler(ConversationHandler(
+    name="ippt",
+    persistent=True,
+
     entry_points=[
       CommandHandler(
         command="ippt",
@@ -100,6 +100,9 @@ async def mc_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def add_handlers(app: Application):
   app.add_handler(ConversationHandler(
+    name="mc",
+    persistent=True,
+
     entry_points=[
       CommandHandler(
         command="mc",
@@ -0,0 +1,60 @@
+from telegram import Update
+from telegram.ext import filters, Application, CommandHandler, ContextTypes
+from datetime import datetime, timezone, timedelta
+import time
+
+from utility.string_casing import uppercase_first_letter
+from utility.constants import PARADE_STATE_DAY_FIELDS, REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL
+
+from db import ReadOnlyDBSession
+from db.classes import ChatGroup
+from db.parade_state import get_parade_state
+
+def describe_count(request_type: str, count) -> str:
+  if count is None:
+    return f"{uppercase_first_letter(request_type)}: 0"
+
+  approval_type = "approved" if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request_type] else "acknowledged"
+  details = []
+  if count.approved:
+    details.append(f"{count.approved} {approval_type}")
+  if count.rejected:
+    details.append(f"{count.rejected} rejected")
+  pending = count.submitted - count.approved - count.rejected
+  if pending:
+    details.append(f"{pending} pending")
+  return f"{uppercase_first_letter(request_type)}: {count.submitted} ({', '.join(details)})"
+
+async def parade_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  async with ReadOnlyDBSession() as db_session:
+    if await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      return
+
+  try:
+    if context.args:
+      day = datetime.strptime(context.args[0], "%d%m%y").date()
+    else:
+      day = datetime.fromtimestamp(time.time(), tz=timezone(timedelta(hours=8))).date()
+  except:
+    await update.message.reply_text(
+      text="Syntax error.\n"
+           "To show the parade state of a day (today if omitted), use:\n"
+           "<code>/parade [DDMMYY]</code>",
+      parse_mode="HTML",
+    )
+    return
+
+  async with ReadOnlyDBSession() as db_session:
+    counts = {count.request_type: count for count in await get_parade_state(db_session, day)}
+
+  await update.message.reply_text(
+    f"Parade state for {datetime.strftime(day, '%d%m%y')}:\n" +
+    "\n".join(describe_count(request_type, counts.get(request_type)) for request_type in PARADE_STATE_DAY_FIELDS)
+  )
+
+def add_handlers(app: Application):
+  app.add_handler(CommandHandler(
+    command="parade",
+    callback=parade_state,
+    filters=filters.ChatType.GROUPS,
+  ))
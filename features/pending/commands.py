@@ -0,0 +1,118 @@
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import filters, Application, CallbackContext, CommandHandler, ContextTypes
+from telegram.error import BadRequest
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+import html
+
+from utility.callback_data import CallbackData, make_callback_data
+from utility.constants import RequestCallbackType, RequestStatus, OPEN_REQUEST_STATUSES
+from utility.string_casing import uppercase_first_letter
+from utility.summarize_request import stringify_field
+from features.shared.callbacks import callback_handlers
+
+from db import ReadOnlyDBSession
+from db.classes import ChatGroup, UNKNOWN_CREATED_AT
+from db.request_repository import OpenRequestsPage, get_open_requests_page
+
+# Lists open requests grouped by status, a page at a time. The Prev/Next
+# buttons carry the (status, ID) key of the first/last request on the page,
+# and the page they lead to is fetched by keyset from that key (see
+# db/request_repository.py).
+
+PENDING_PAGE_SIZE = 15
+
+def describe_status(status: RequestStatus) -> str:
+  return uppercase_first_letter(status.name.replace("_", " ").lower())
+
+def make_page_keyboard(page: OpenRequestsPage) -> InlineKeyboardMarkup:
+  buttons = []
+  if page.has_previous:
+    first = page.requests[0]
+    buttons.append(InlineKeyboardButton(
+      text="« Prev",
+      callback_data=make_callback_data(RequestCallbackType.PENDING_PREVIOUS_PAGE, (first.status.value, first.id)),
+    ))
+  if page.has_next:
+    last = page.requests[-1]
+    buttons.append(InlineKeyboardButton(
+      text="Next »",
+      callback_data=make_callback_data(RequestCallbackType.PENDING_NEXT_PAGE, (last.status.value, last.id)),
+    ))
+  return InlineKeyboardMarkup((buttons,)) if buttons else None
+
+def describe_page(page: OpenRequestsPage) -> str:
+  if not page.requests:
+    return "There are no open requests."
+
+  sections = []
+  for status, requests in groupby(page.requests, key=lambda request: request.status):
+    sections.append(
+      f"<b>{describe_status(status)}</b>\n" +
+      "\n".join(
+        f"Ref. {request.id} ({html.escape(request.request_type)}): "
+        f"{html.escape(str(request.info.get('rank_name', '')))}" +
+        (
+          f", submitted {stringify_field(datetime.fromtimestamp(request.created_at, tz=timezone(timedelta(hours=8))))}"
+          if request.created_at != UNKNOWN_CREATED_AT else ""
+        )
+        for request in requests
+      )
+    )
+  return "Open requests:\n\n" + "\n\n".join(sections)
+
+async def pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  async with ReadOnlyDBSession() as db_session:
+    # requests contain trainees' personal details
+    if await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      return
+
+    page = await get_open_requests_page(db_session, PENDING_PAGE_SIZE)
+
+  await update.message.reply_text(
+    text=describe_page(page),
+    parse_mode="HTML",
+    reply_markup=make_page_keyboard(page),
+  )
+
+async def turn_page(update: Update, context: CallbackContext, callback_data: CallbackData):
+  query = update.callback_query
+  try:
+    status_value, request_id = callback_data.args
+    key = (RequestStatus(status_value), request_id)
+    assert key[0] in OPEN_REQUEST_STATUSES
+  except (AssertionError, TypeError, ValueError):
+    await query.answer()
+    return
+
+  async with ReadOnlyDBSession() as db_session:
+    # the buttons may have been forwarded out of the group
+    if update.effective_chat is None or await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      await query.answer()
+      return
+
+    if callback_data.callback_type == RequestCallbackType.PENDING_NEXT_PAGE:
+      page = await get_open_requests_page(db_session, PENDING_PAGE_SIZE, after=key)
+    else:
+      page = await get_open_requests_page(db_session, PENDING_PAGE_SIZE, before=key)
+
+  try:
+    await query.edit_message_text(
+      text=describe_page(page),
+      parse_mode="HTML",
+      reply_markup=make_page_keyboard(page),
+    )
+  except BadRequest as err:
+    # pressing a button twice fetches the same page
+    if "not modified" not in err.message.lower():
+      raise
+  await query.answer()
+
+def add_handlers(app: Application):
+  app.add_handler(CommandHandler(
+    command="pending",
+    callback=pending,
+    filters=filters.ChatType.GROUPS,
+  ))
+  callback_handlers[RequestCallbackType.PENDING_NEXT_PAGE] = turn_page
+  callback_handlers[RequestCallbackType.PENDING_PREVIOUS_PAGE] = turn_page
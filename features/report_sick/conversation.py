@@ -101,6 +101,9 @@ async def report_sick_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 def add_handlers(app: Application):
   app.add_handler(ConversationHandler(
+    name="report_sick",
+    persistent=True,
+
     entry_points=[
       CommandHandler(
         command="reportsick",
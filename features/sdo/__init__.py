@@ -1,5 +1,6 @@
 from telegram.ext import Application
 from . import conversation
+from .roster import load_roster
 
 def init(app: Application):
   conversation.add_handlers(app)
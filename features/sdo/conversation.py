@@ -1,45 +1,26 @@
 from telegram import Update, MessageEntity
-from telegram.error import TelegramError
 from telegram.ext import filters, Application, CommandHandler, ContextTypes, ConversationHandler
 import time
 
 from utility.constants import HOTOConversationState
+from internal.sharding import broadcast
 
-from sqlalchemy import select, func
-from sqlalchemy.orm import Session as DBSession
-from db import engine
+from db import AsyncDBSession
 from db.classes import SDOLogEntry
 
-# FIXME: things will break if some incoming SDO has no username
+from .roster import ROSTER_CHANGED, RosterEntry, get_roster, replace_roster
 
-def get_current_sdos():
-  with DBSession(engine) as db_session:
-    latest_hoto_time = db_session.scalar(select(func.max(SDOLogEntry.time)))
-    return db_session.execute(
-      select(
-        SDOLogEntry.sdo_id,
-        SDOLogEntry.sdo_info,
-      ).where(SDOLogEntry.time == latest_hoto_time)
-    )
+# FIXME: things will break if some incoming SDO has no username
 
 async def sdo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-  sdo_usernames_and_info = []
-  for row in get_current_sdos():
-    try:
-      sdo_usernames_and_info.append((
-        (await context.bot.get_chat(row.sdo_id)).username,
-        row.sdo_info,
-      ))
-    except TelegramError:
-      # No user with that ID. Account was probably deleted.
-      pass
+  roster = await get_roster(context.application)
   
-  if sdo_usernames_and_info:
+  if roster:
     await update.message.reply_text(
       "Current SDOs:\n" +
       "\n".join(
-        f"{sdo_info}: @{sdo_username}"
-        for sdo_username, sdo_info in sdo_usernames_and_info
+        f"{entry.sdo_info}: @{entry.sdo_username}"
+        for entry in roster
       )
     )
   else:
@@ -99,8 +80,10 @@ async def hoto_acknowledge(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
   hoto_data["not_acknowledged"].remove(update.effective_user.username)
   # don't use context.args because consecutive whitespace chars are lost
-  hoto_data["acknowledged"][update.effective_user.id] = \
-    update.message.text.split(maxsplit=1)[1]
+  hoto_data["acknowledged"][update.effective_user.id] = (
+    update.effective_user.username,
+    update.message.text.split(maxsplit=1)[1],
+  )
 
   if hoto_data["not_acknowledged"]:
     await update.message.reply_text(
@@ -111,12 +94,20 @@ async def hoto_acknowledge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return HOTOConversationState.IN_PROGRESS
   
   hoto_time = time.time()
-  with DBSession(engine) as db_session:
-    for sdo_id, sdo_info in hoto_data["acknowledged"].items():
+  async with AsyncDBSession() as db_session:
+    for sdo_id, (_, sdo_info) in hoto_data["acknowledged"].items():
       incoming_sdo = SDOLogEntry(time=hoto_time, sdo_id=sdo_id, sdo_info=sdo_info)
       db_session.add(incoming_sdo)  
 
-    db_session.commit()
+    await db_session.commit()
+
+  # usernames were already known when the incoming SDOs acknowledged,
+  # so the new roster needs no further lookups
+  replace_roster(
+    RosterEntry(sdo_id, sdo_username, sdo_info)
+    for sdo_id, (sdo_username, sdo_info) in hoto_data["acknowledged"].items()
+  )
+  broadcast(ROSTER_CHANGED)
 
   await update.message.reply_text(
     "All incoming SDOs have acknowledged. HOTO complete.\n"
@@ -138,6 +129,9 @@ async def hoto_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def add_handlers(app: Application):
   app.add_handler(CommandHandler(command="sdo", callback=sdo))
   app.add_handler(ConversationHandler(
+    name="hoto",
+    persistent=True,
+
     # allows the ConversationHandler to listen to more than one user's commands at once
     per_user=False,
 
@@ -0,0 +1,70 @@
+# In-process cache of the current SDOs, so that /sdo can be answered without
+# querying the DB or calling the Telegram API.
+# The roster is loaded at startup and replaced whenever a HOTO completes.
+# In sharded mode, the worker that completed the HOTO has the others reload it.
+
+from telegram.ext import Application
+from typing import NamedTuple, Optional
+from functools import partial
+import logging
+
+from internal.user_profiles import get_username
+from internal.sharding import on_broadcast
+from utility.fan_out import fan_out
+
+from sqlalchemy import select, func
+from db import ReadOnlyDBSession
+from db.classes import SDOLogEntry
+
+logger = logging.getLogger(__name__)
+
+ROSTER_CHANGED = "roster_changed"
+
+class RosterEntry(NamedTuple):
+  sdo_id: int
+  sdo_username: str
+  sdo_info: str
+
+# None until loaded. Always replaced as a whole rather than mutated, so readers
+# never observe a partially updated roster.
+_roster: Optional[tuple[RosterEntry, ...]] = None
+
+async def get_current_sdos():
+  async with ReadOnlyDBSession() as db_session:
+    latest_hoto_time = await db_session.scalar(select(func.max(SDOLogEntry.time)))
+    return (await db_session.execute(
+      select(
+        SDOLogEntry.sdo_id,
+        SDOLogEntry.sdo_info,
+      ).where(SDOLogEntry.time == latest_hoto_time)
+    )).all()
+
+async def load_roster(app: Application):
+  rows = await get_current_sdos()
+  usernames = await fan_out(
+    (partial(get_username, app, row.sdo_id) for row in rows),
+    max_concurrency=len(rows) or 1,
+  )
+
+  entries = []
+  for row, username in zip(rows, usernames):
+    if isinstance(username, BaseException):
+      raise username
+    elif username is None:
+      # No user with that ID. Account was probably deleted.
+      continue
+    entries.append(RosterEntry(row.sdo_id, username, row.sdo_info))
+
+  replace_roster(entries)
+  logger.info(f"Loaded roster of {len(entries)} SDO(s)")
+
+def replace_roster(entries):
+  global _roster
+  _roster = tuple(entries)
+
+async def get_roster(app: Application):
+  if _roster is None:
+    await load_roster(app)
+  return _roster
+
+on_broadcast(ROSTER_CHANGED, load_roster)
@@ -0,0 +1,53 @@
+from telegram import Update
+from telegram.ext import filters, Application, CommandHandler, ContextTypes
+import html
+
+from db import ReadOnlyDBSession
+from db.classes import ChatGroup
+from db.search import is_search_available, search_requests
+
+MAX_SEARCH_RESULTS = 10
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  if not context.args:
+    await update.message.reply_text(
+      text="Syntax error.\n"
+           "To search the contents of requests, use:\n"
+           "<code>/search [terms]</code>\n"
+           "E.g. <code>/search SBA1234X</code> or <code>/search enquiry IPPT</code>",
+      parse_mode="HTML",
+    )
+    return
+
+  async with ReadOnlyDBSession() as db_session:
+    # requests contain trainees' personal details
+    if await db_session.get(ChatGroup, update.effective_chat.id) is None:
+      return
+
+    if not is_search_available(db_session):
+      await update.message.reply_text("Search is only available with an SQLite database.")
+      return
+
+    results = await search_requests(db_session, context.args, limit=MAX_SEARCH_RESULTS)
+
+  if not results:
+    await update.message.reply_text("No requests match your search.")
+    return
+
+  await update.message.reply_text(
+    text=f"Top {len(results)} result(s):\n\n" +
+         "\n\n".join(
+           f"<b>Ref. {result.id}</b> ({html.escape(result.request_type)}"
+           f"{', archived' if result.is_archived else ''}): {html.escape(result.rank_name or '')}\n"
+           f"{result.snippet}"
+           for result in results
+         ),
+    parse_mode="HTML",
+  )
+
+def add_handlers(app: Application):
+  app.add_handler(CommandHandler(
+    command="search",
+    callback=search,
+    filters=filters.ChatType.GROUPS,
+  ))
@@ -1,10 +1,10 @@
 from telegram import Update
 from telegram.ext import filters, Application, CommandHandler, ContextTypes
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session as DBSession
-from db import engine
-from db.classes import Request
+from internal.user_profiles import get_username
+
+from db import ReadOnlyDBSession
+from db.request_repository import get_sender_id
 
 async def message_requestor(update: Update, context: ContextTypes.DEFAULT_TYPE):
   try:
@@ -19,17 +19,15 @@ async def message_requestor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return
   
-  with DBSession(engine) as db_session:
-    requestor_id = db_session.scalar(
-      select(Request.sender_id).where(Request.id == request_id)
-    )    
+  async with ReadOnlyDBSession() as db_session:
+    requestor_id = await get_sender_id(db_session, request_id)
     if requestor_id is None:
       await update.message.reply_text(f"No request with reference no. {request_id}.")
       return
 
     await context.bot.send_message(chat_id=requestor_id, text=text_to_send)
 
-    requestor_username = (await context.bot.get_chat(requestor_id)).username
+    requestor_username = await get_username(context.application, requestor_id)
     requestor_mention_text = f"@{requestor_username}" if requestor_username else "requestor"
     await update.message.reply_text(
       # Note: no XSS risk because Telegram usernames can only include a-z, 0-9 and underscores
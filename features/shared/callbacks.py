@@ -5,151 +5,197 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import Application, CallbackContext, CallbackQueryHandler
 import logging
 
-from utility.callback_data import match_callback_type, make_callback_data, parse_callback_data
+from utility.callback_data import CallbackData, make_callback_data, parse_callback_data
 from utility.string_casing import uppercase_first_letter
 from utility.constants import RequestCallbackType, RequestStatus, REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL
+from internal.keyboard_edits import queue_reply_markup_edit
 
-from sqlalchemy.orm import Session as DBSession
-from sqlalchemy import select
-from db import engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import AsyncDBSession
 from db.classes import Request, RequestVerdictNotification
+from db.request_repository import get_request, change_statuses_if_unchanged
 
 logger = logging.getLogger(__name__)
 
-async def acknowledge(update: Update, context: CallbackContext):
+# a verdict must be undone before another can be given
+DECIDED_STATUSES = (RequestStatus.APPROVED, RequestStatus.REJECTED)
+
+# Presses on the same request from different groups are handled concurrently,
+# so each status change is claimed with a conditional update, and only made
+# if the request is still in the status it was read in, before the trainee is
+# told. A change whose message cannot be delivered is reverted.
+
+def edit_notification_keyboards(context: CallbackContext, request: Request, reply_markup: InlineKeyboardMarkup):
+  # update inline keyboards of all notification messages associated with this request
+  for message in request.notifications:
+    queue_reply_markup_edit(context.application, message.chat_id, message.message_id, reply_markup)
+
+async def restore_verdict(
+  db_session: AsyncSession,
+  request: Request,
+  verdict_status: RequestStatus,
+  verdict_notification: RequestVerdictNotification,
+):
+  # after an undo whose verdict message could not be deleted
+  if await change_statuses_if_unchanged(db_session, [request], verdict_status):
+    request.verdict_notification = RequestVerdictNotification(
+      chat_id=verdict_notification.chat_id,
+      message_id=verdict_notification.message_id,
+      request=request,
+    )
+    db_session.add(request.verdict_notification)
+  await db_session.commit()
+
+def get_approval_type(request_type: str) -> str:
+  return "approved" if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request_type] else "acknowledged"
+
+def make_approved_keyboard(request: Request, username: str) -> InlineKeyboardMarkup:
+  return InlineKeyboardMarkup((
+    (
+      InlineKeyboardButton(
+        text=f"{uppercase_first_letter(get_approval_type(request.request_type))} by @{username}. Click to undo.",
+        callback_data=make_callback_data(RequestCallbackType.UNDO_APPROVE, (request.id,))
+      ),
+    ),
+  ))
+
+async def acknowledge(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     if request is None:
       logger.warning(f"acknowledge callback received nonexistent request ID {request_id}.")
       await query.answer()
       return
+    # the button is stale if the request has moved on, e.g. by a press in another group
+    if request.status != RequestStatus.PENDING_ACKNOWLEDGEMENT \
+       or not await change_statuses_if_unchanged(db_session, [request], RequestStatus.ACKNOWLEDGED):
+      logger.warning(f"acknowledge callback received request ID {request_id} that is no longer pending acknowledgement.")
+      await query.answer()
+      return
+    await db_session.commit()
 
-    request.status = RequestStatus.ACKNOWLEDGED
-    db_session.commit()
-
-    await context.bot.send_message(
-      chat_id=request.sender_id,
-      text=f"Your {request.info['type']} (ref. {request_id}) has been acknowledged by the SDO. "
-           "You will be notified when the relevant approving party has been informed."
-    )
-
-    # update inline keyboards of all notification messages associated with this request
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text="Approving party informed",
-              callback_data=make_callback_data(RequestCallbackType.APPROVER_NOTIFIED, (request.id,)),
-            ),
-          ),
-          (
-            InlineKeyboardButton(
-              text="Reject without notifying approver",
-              callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,)),
-            ),
-          ),
-        ))
+    try:
+      await context.bot.send_message(
+        chat_id=request.sender_id,
+        text=f"Your {request.request_type} (ref. {request_id}) has been acknowledged by the SDO. "
+             "You will be notified when the relevant approving party has been informed."
       )
+    except:
+      await change_statuses_if_unchanged(db_session, [request], RequestStatus.PENDING_ACKNOWLEDGEMENT)
+      await db_session.commit()
+      raise
+
+    edit_notification_keyboards(context, request, InlineKeyboardMarkup((
+      (
+        InlineKeyboardButton(
+          text="Approving party informed",
+          callback_data=make_callback_data(RequestCallbackType.APPROVER_NOTIFIED, (request.id,)),
+        ),
+      ),
+      (
+        InlineKeyboardButton(
+          text="Reject without notifying approver",
+          callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,)),
+        ),
+      ),
+    )))
 
   await query.answer()
 
-async def approver_notified(update: Update, context: CallbackContext):
+async def approver_notified(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     if request is None:
       logger.warning(f"approver_notified callback received nonexistent request ID {request_id}.")
       await query.answer()
       return
+    if request.status != RequestStatus.ACKNOWLEDGED \
+       or not await change_statuses_if_unchanged(db_session, [request], RequestStatus.APPROVER_NOTIFIED):
+      logger.warning(f"approver_notified callback received request ID {request_id} that is no longer acknowledged.")
+      await query.answer()
+      return
+    await db_session.commit()
 
-    request.status = RequestStatus.APPROVER_NOTIFIED
-    db_session.commit()
-
-    await context.bot.send_message(
-      chat_id=request.sender_id,
-      text=f"The relevant approving party has been informed of your {request.info['type']} (ref. {request_id}). "
-           "You will be notified when it is approved or rejected."
-    )
-
-    # update inline keyboards of all notification messages associated with this request
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text="Approve",
-              callback_data=make_callback_data(RequestCallbackType.APPROVE, (request.id,))
-            ),
-            InlineKeyboardButton(
-              text="Reject",
-              callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,))
-            ),
-          ),
-        )),
+    try:
+      await context.bot.send_message(
+        chat_id=request.sender_id,
+        text=f"The relevant approving party has been informed of your {request.request_type} (ref. {request_id}). "
+             "You will be notified when it is approved or rejected."
       )
+    except:
+      await change_statuses_if_unchanged(db_session, [request], RequestStatus.ACKNOWLEDGED)
+      await db_session.commit()
+      raise
+
+    edit_notification_keyboards(context, request, InlineKeyboardMarkup((
+      (
+        InlineKeyboardButton(
+          text="Approve",
+          callback_data=make_callback_data(RequestCallbackType.APPROVE, (request.id,))
+        ),
+        InlineKeyboardButton(
+          text="Reject",
+          callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,))
+        ),
+      ),
+    )))
 
   await query.answer()
 
-async def approve(update: Update, context: CallbackContext):
+async def approve(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     if request is None:
       logger.warning(f"approve callback received nonexistent request ID {request_id}.")
       await query.answer()
       return
+    # e.g. approved by /approve or a press in another group, or a repeated press
+    old_status = request.status
+    if old_status in DECIDED_STATUSES \
+       or not await change_statuses_if_unchanged(db_session, [request], RequestStatus.APPROVED):
+      logger.warning(f"approve callback received already decided request ID {request_id}.")
+      await query.answer()
+      return
+    await db_session.commit()
 
-    requires_independent_approval = REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request.info["type"]]
-    approval_type = "approved" if requires_independent_approval else "acknowledged"
-    
-    verdict_notification = await context.bot.send_message(
-      chat_id=request.sender_id,
-      text=f"Your {request.info['type']} (ref. {request_id}) has been {approval_type}.",
-    )
+    try:
+      verdict_notification = await context.bot.send_message(
+        chat_id=request.sender_id,
+        text=f"Your {request.request_type} (ref. {request_id}) has been {get_approval_type(request.request_type)}.",
+      )
+    except:
+      # undoing the approval needs the verdict message
+      await change_statuses_if_unchanged(db_session, [request], old_status)
+      await db_session.commit()
+      raise
 
-    request.status = RequestStatus.APPROVED
     request.verdict_notification = RequestVerdictNotification(
       chat_id=request.sender_id,
       message_id=verdict_notification.id,
       request=request,
     )
     db_session.add(request.verdict_notification)
-    db_session.commit()
-
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text=f"{uppercase_first_letter(approval_type)} by @{update.effective_user.username}. Click to undo.",
-              callback_data=make_callback_data(RequestCallbackType.UNDO_APPROVE, (request.id,))
-            ),
-          ),
-        )),
-      )
+    await db_session.commit()
+
+    edit_notification_keyboards(context, request, make_approved_keyboard(request, update.effective_user.username))
 
   await query.answer()
 
-async def undo_approve(update: Update, context: CallbackContext):
+async def undo_approve(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     try:
       assert request is not None, \
         f"undo_approve callback received nonexistent request ID {request_id}."
@@ -162,17 +208,26 @@ async def undo_approve(update: Update, context: CallbackContext):
       await query.answer()
       return
 
-    await context.bot.delete_message(
-      chat_id=request.verdict_notification.chat_id,
-      message_id=request.verdict_notification.message_id,
-    )
-    request.status = RequestStatus.APPROVAL_REVOKED
-    db_session.delete(request.verdict_notification)
+    verdict_notification = request.verdict_notification
+    if not await change_statuses_if_unchanged(db_session, [request], RequestStatus.APPROVAL_REVOKED):
+      logger.warning(f"undo_approve callback received request ID {request_id} whose approval was already undone.")
+      await query.answer()
+      return
+    await db_session.delete(verdict_notification)
     request.verdict_notification = None
-    
-    db_session.commit()
+    await db_session.commit()
 
-    if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request.info["type"]]:
+    try:
+      await context.bot.delete_message(
+        chat_id=verdict_notification.chat_id,
+        message_id=verdict_notification.message_id,
+      )
+    except:
+      # the approval stands while the trainee still has its message
+      await restore_verdict(db_session, request, RequestStatus.APPROVED, verdict_notification)
+      raise
+
+    if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request.request_type]:
       reply_markup = InlineKeyboardMarkup((
         (
           InlineKeyboardButton(
@@ -195,62 +250,63 @@ async def undo_approve(update: Update, context: CallbackContext):
         ),
       ))
 
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=reply_markup,
-      )
+    edit_notification_keyboards(context, request, reply_markup)
 
   await query.answer()    
 
-async def reject(update: Update, context: CallbackContext):
+async def reject(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     if request is None:
       logger.warning(f"reject callback received nonexistent request ID {request_id}.")
       await query.answer()
       return
+    old_status = request.status
+    if old_status in DECIDED_STATUSES \
+       or not await change_statuses_if_unchanged(db_session, [request], RequestStatus.REJECTED):
+      logger.warning(f"reject callback received already decided request ID {request_id}.")
+      await query.answer()
+      return
+    await db_session.commit()
 
-    verdict_notification = await context.bot.send_message(
-      chat_id=request.sender_id,
-      text=f"Your {request.info['type']} (ref. {request_id}) has been rejected."
-    )
+    try:
+      verdict_notification = await context.bot.send_message(
+        chat_id=request.sender_id,
+        text=f"Your {request.request_type} (ref. {request_id}) has been rejected."
+      )
+    except:
+      await change_statuses_if_unchanged(db_session, [request], old_status)
+      await db_session.commit()
+      raise
 
-    request.status = RequestStatus.REJECTED
     request.verdict_notification = RequestVerdictNotification(
       chat_id=request.sender_id,
       message_id=verdict_notification.id,
       request=request,
     )
     db_session.add(request.verdict_notification)
-    db_session.commit()
-
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text=f"Rejected by @{update.effective_user.username}. Click to undo.",
-              callback_data=make_callback_data(RequestCallbackType.UNDO_REJECT, (request.id,))
-            ),
-          ),
-        )),
-      )
+    await db_session.commit()
+
+    edit_notification_keyboards(context, request, InlineKeyboardMarkup((
+      (
+        InlineKeyboardButton(
+          text=f"Rejected by @{update.effective_user.username}. Click to undo.",
+          callback_data=make_callback_data(RequestCallbackType.UNDO_REJECT, (request.id,))
+        ),
+      ),
+    )))
 
   await query.answer()
 
-async def undo_reject(update: Update, context: CallbackContext):
+async def undo_reject(update: Update, context: CallbackContext, callback_data: CallbackData):
   query = update.callback_query
-  request_id = parse_callback_data(query.data)[0]
+  request_id = callback_data.request_id
 
-  with DBSession(engine) as db_session:
-    request = db_session.scalar(select(Request).where(Request.id == request_id))
+  async with AsyncDBSession() as db_session:
+    request = await get_request(db_session, request_id)
     try:
       assert request is not None, \
         f"undo_reject callback received nonexistent request ID {request_id}."
@@ -263,63 +319,57 @@ async def undo_reject(update: Update, context: CallbackContext):
       await query.answer()
       return
 
-    await context.bot.delete_message(
-      chat_id=request.verdict_notification.chat_id,
-      message_id=request.verdict_notification.message_id,
-    )
-    request.status = RequestStatus.REJECTION_REVOKED
-    db_session.delete(request.verdict_notification)
+    verdict_notification = request.verdict_notification
+    if not await change_statuses_if_unchanged(db_session, [request], RequestStatus.REJECTION_REVOKED):
+      logger.warning(f"undo_reject callback received request ID {request_id} whose rejection was already undone.")
+      await query.answer()
+      return
+    await db_session.delete(verdict_notification)
     request.verdict_notification = None
+    await db_session.commit()
 
-    db_session.commit()
-
-    for message in request.notifications:
-      await context.bot.edit_message_reply_markup(
-        chat_id=message.chat_id,
-        message_id=message.message_id,
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text="Approve",
-              callback_data=make_callback_data(RequestCallbackType.APPROVE, (request.id,))
-            ),
-            InlineKeyboardButton(
-              text="Reject",
-              callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,))
-            ),
-          ),
-        )),
+    try:
+      await context.bot.delete_message(
+        chat_id=verdict_notification.chat_id,
+        message_id=verdict_notification.message_id,
       )
+    except:
+      await restore_verdict(db_session, request, RequestStatus.REJECTED, verdict_notification)
+      raise
+
+    edit_notification_keyboards(context, request, InlineKeyboardMarkup((
+      (
+        InlineKeyboardButton(
+          text="Approve",
+          callback_data=make_callback_data(RequestCallbackType.APPROVE, (request.id,))
+        ),
+        InlineKeyboardButton(
+          text="Reject",
+          callback_data=make_callback_data(RequestCallbackType.REJECT, (request.id,))
+        ),
+      ),
+    )))
 
   await query.answer()
 
+# callback data is parsed once by route_callback and dispatched on its type
+callback_handlers = {
+  RequestCallbackType.ACKNOWLEDGE: acknowledge,
+  RequestCallbackType.APPROVER_NOTIFIED: approver_notified,
+  RequestCallbackType.APPROVE: approve,
+  RequestCallbackType.REJECT: reject,
+  RequestCallbackType.UNDO_APPROVE: undo_approve,
+  RequestCallbackType.UNDO_REJECT: undo_reject,
+}
+
+async def route_callback(update: Update, context: CallbackContext):
+  callback_data = parse_callback_data(update.callback_query.data)
+  handler = callback_handlers.get(callback_data.callback_type) if callback_data else None
+  if handler is None:
+    logger.warning(f"Unhandled callback message. Data: {update.callback_query.data!r}")
+    return
+
+  await handler(update, context, callback_data)
+
 def add_handlers(app: Application):
-  app.add_handler(CallbackQueryHandler(
-    acknowledge,
-    pattern=match_callback_type(RequestCallbackType.ACKNOWLEDGE),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    approver_notified,
-    pattern=match_callback_type(RequestCallbackType.APPROVER_NOTIFIED),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    approve,
-    pattern=match_callback_type(RequestCallbackType.APPROVE),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    reject,
-    pattern=match_callback_type(RequestCallbackType.REJECT),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    undo_approve,
-    pattern=match_callback_type(RequestCallbackType.UNDO_APPROVE),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    undo_reject,
-    pattern=match_callback_type(RequestCallbackType.UNDO_REJECT),
-  ))
-  app.add_handler(CallbackQueryHandler(
-    lambda update, context: logger.warning(
-      f"Unhandled callback message. Data: {update.callback_query.data!r}"
-    ),
-  ))
+  app.add_handler(CallbackQueryHandler(route_callback))
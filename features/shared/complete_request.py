@@ -1,16 +1,24 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from datetime import datetime, date, timezone, timedelta
+from functools import partial
+import logging
 
 from utility.summarize_request import summarize_request
 from utility.callback_data import make_callback_data
 from utility.string_casing import uppercase_first_letter
-from utility.constants import RequestCallbackType, REQUEST_TYPE_REQUIRES_APPROVAL, REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL
+from utility.fan_out import fan_out
+from utility.bot_config import get_bot_config
+from internal.keyboard_edits import record_sent_markup
+from internal.metrics import REQUESTS_SUBMITTED
+from utility.constants import RequestCallbackType, REQUEST_TYPE_REQUIRES_APPROVAL, REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL, DEFAULT_MAX_CONCURRENT_NOTIFICATIONS
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session as DBSession
-from db import engine
+from sqlalchemy import select, insert
+from db import AsyncDBSession
 from db.classes import Request, RequestNotification, ChatGroup
+from db.parade_state import record_submission
+
+logger = logging.getLogger(__name__)
 
 async def complete_request(
     request_type: str,
@@ -21,11 +29,9 @@ async def complete_request(
   user_id = update.effective_user.id
   fields = context.user_data[request_type]
 
-  # disable expire_on_commit so we don't need to start another transaction
-  # to load request ID after commit
-  with DBSession(engine, expire_on_commit=False) as db_session:
-    request_info = {"type": request_type, **fields}
-    
+  async with AsyncDBSession() as db_session:
+    request_info = dict(fields)
+
     for field in request_info:
       if isinstance(request_info[field], datetime):
         request_info[field] = request_info[field].timestamp()
@@ -37,55 +43,79 @@ async def complete_request(
           tzinfo=timezone(timedelta(hours=8)),
         ).timestamp()
 
-    request = Request(sender_id=user_id, info=request_info)
+    request = Request(sender_id=user_id, request_type=request_type, info=request_info)
     db_session.add(request)
-    db_session.commit()
-
-    await update.message.reply_text(
-      f"{uppercase_first_letter(request_type)} submitted; reference no. is {request.id}.\n"
-      f"{additional_completion_text}\n"
-      "If you wish to carry out more actions, send /help for a list of commands."
-    )
-
-    for group_id in db_session.scalars(select(ChatGroup.id)):
-      sdo_notification_text = \
-        f"New {request_type} from @{update.effective_user.username}:\n" + \
-        f"{summarize_request(request_type, fields)}\n" + \
-        f"<b>Reference no.: {request.id}</b>\n\n" + \
-        "To send additional information to this user via the bot, use:\n" + \
-        f"<code>/pm {request.id} [text to send]</code>\n"
-      
-      if request_type == "enquiry":
-        sdo_notification_text += \
-          "To resolve this enquiry, use:\n" + \
-          f"<code>/resolve {request.id}</code>\n"
-
-      sent_message = await context.bot.send_message(
+    await record_submission(db_session, request_type, request_info)
+    await db_session.commit()
+    REQUESTS_SUBMITTED.labels(request_type).inc()
+
+    group_ids = (await db_session.scalars(select(ChatGroup.id))).all()
+
+  await update.message.reply_text(
+    f"{uppercase_first_letter(request_type)} submitted; reference no. is {request.id}.\n"
+    f"{additional_completion_text}\n"
+    "If you wish to carry out more actions, send /help for a list of commands."
+  )
+
+  sdo_notification_text = \
+    f"New {request_type} from @{update.effective_user.username}:\n" + \
+    f"{summarize_request(request_type, fields)}\n" + \
+    f"<b>Reference no.: {request.id}</b>\n\n" + \
+    "To send additional information to this user via the bot, use:\n" + \
+    f"<code>/pm {request.id} [text to send]</code>\n"
+
+  if request_type == "enquiry":
+    sdo_notification_text += \
+      "To resolve this enquiry, use:\n" + \
+      f"<code>/resolve {request.id}</code>\n"
+
+  reply_markup = InlineKeyboardMarkup((
+    (
+      InlineKeyboardButton(
+        text="Acknowledge",
+        callback_data=make_callback_data(
+          callback_type=RequestCallbackType.ACKNOWLEDGE
+                        if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request_type]
+                        else RequestCallbackType.APPROVE,
+          data=(request.id,)
+        )
+      ),
+    ),
+  )) if REQUEST_TYPE_REQUIRES_APPROVAL[request_type] else None
+
+  # send to all groups concurrently so that one slow or failing group
+  # neither delays nor prevents delivery to the others
+  sent_messages = await fan_out(
+    (
+      partial(
+        context.bot.send_message,
         group_id,
         text=sdo_notification_text,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup((
-          (
-            InlineKeyboardButton(
-              text="Acknowledge",
-              callback_data=make_callback_data(
-                callback_type=RequestCallbackType.ACKNOWLEDGE
-                              if REQUEST_TYPE_REQUIRES_INDEPENDENT_APPROVAL[request_type]
-                              else RequestCallbackType.APPROVE,
-                data=(request.id,)
-              )
-            ),
-          ),
-        )) if REQUEST_TYPE_REQUIRES_APPROVAL[request_type] else None,
+        reply_markup=reply_markup,
       )
+      for group_id in group_ids
+    ),
+    max_concurrency=get_bot_config().get(
+      "max_concurrent_notifications",
+      DEFAULT_MAX_CONCURRENT_NOTIFICATIONS,
+    ),
+  )
 
-      db_message = RequestNotification(
-        chat_id=group_id,
-        message_id=sent_message.id,
-        request=request,
-      )
-      db_session.add(db_message)
+  notifications = []
+  for group_id, sent_message in zip(group_ids, sent_messages):
+    if isinstance(sent_message, BaseException):
+      logger.error(f"Failed to notify group ID {group_id} of request {request.id}: {sent_message!r}")
+      continue
+
+    if reply_markup is not None:
+      record_sent_markup(group_id, sent_message.id, reply_markup)
+    notifications.append({
+      "chat_id": group_id,
+      "message_id": sent_message.id,
+      "request_id": request.id,
+    })
 
-    db_session.commit()
-  
-  
+  if notifications:
+    async with AsyncDBSession() as db_session, db_session.begin():
+      await db_session.execute(insert(RequestNotification), notifications)
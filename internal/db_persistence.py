@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import pickle
+from typing import Callable, Optional
+from telegram.ext import BasePersistence, PersistenceInput
+
+from sqlalchemy import select, delete, insert, tuple_
+from db import AsyncDBSession, ReadOnlyDBSession
+from db.classes import PersistedUserData, PersistedChatData, PersistedConversation
+
+# Persists user_data, chat_data and conversation states in the bot's database,
+# so that half-filled forms and in-progress HOTOs survive restarts.
+# The Application hands over changed data every `update_interval` seconds and
+# at shutdown. Changes are staged in memory and written in one transaction per
+# round instead of one write per chat.
+# Values are pickled because they contain dates, sets and enum members.
+# In sharded mode, `owns_user` limits user_data writes to the users whose data
+# this process owns, so that other workers' stale copies never overwrite it.
+
+logger = logging.getLogger(__name__)
+
+class DBPersistence(BasePersistence):
+  def __init__(self, update_interval: float = 60, owns_user: Optional[Callable[[int], bool]] = None):
+    super().__init__(
+      store_data=PersistenceInput(bot_data=False, callback_data=False),
+      update_interval=update_interval,
+    )
+    # None marks data to be deleted
+    self._staged_user_data = {}
+    self._staged_chat_data = {}
+    self._staged_conversations = {}
+    self._owns_user = owns_user
+    self._write_task = None
+    self._write_lock = asyncio.Lock()
+
+  async def get_user_data(self):
+    async with ReadOnlyDBSession() as db_session:
+      return {
+        row.user_id: pickle.loads(row.data)
+        for row in await db_session.scalars(select(PersistedUserData))
+      }
+
+  async def get_chat_data(self):
+    async with ReadOnlyDBSession() as db_session:
+      return {
+        row.chat_id: pickle.loads(row.data)
+        for row in await db_session.scalars(select(PersistedChatData))
+      }
+
+  async def get_bot_data(self):
+    return {}
+
+  async def get_callback_data(self):
+    return None
+
+  async def get_conversations(self, name):
+    async with ReadOnlyDBSession() as db_session:
+      return {
+        tuple(json.loads(row.key)): pickle.loads(row.state)
+        for row in await db_session.scalars(
+          select(PersistedConversation).where(PersistedConversation.name == name)
+        )
+      }
+
+  async def update_user_data(self, user_id, data):
+    if self._owns_user is not None and not self._owns_user(user_id):
+      return
+    self._staged_user_data[user_id] = data
+    self._schedule_write()
+
+  async def update_chat_data(self, chat_id, data):
+    self._staged_chat_data[chat_id] = data
+    self._schedule_write()
+
+  async def update_conversation(self, name, key, new_state):
+    self._staged_conversations[(name, json.dumps(key))] = new_state
+    self._schedule_write()
+
+  async def drop_user_data(self, user_id):
+    if self._owns_user is not None and not self._owns_user(user_id):
+      return
+    self._staged_user_data[user_id] = None
+    self._schedule_write()
+
+  async def drop_chat_data(self, chat_id):
+    self._staged_chat_data[chat_id] = None
+    self._schedule_write()
+
+  async def update_bot_data(self, data):
+    pass
+
+  async def update_callback_data(self, data):
+    pass
+
+  async def refresh_user_data(self, user_id, user_data):
+    pass
+
+  async def refresh_chat_data(self, chat_id, chat_data):
+    pass
+
+  async def refresh_bot_data(self, bot_data):
+    pass
+
+  async def flush(self):
+    if self._write_task is not None:
+      await self._write_task
+    await self._write_staged()
+
+  def _schedule_write(self):
+    if self._write_task is None:
+      self._write_task = asyncio.create_task(self._write_after_staging())
+
+  async def _write_after_staging(self):
+    # the Application stages all changes of a round concurrently,
+    # so yield once to let the rest of them arrive
+    await asyncio.sleep(0)
+    self._write_task = None
+    try:
+      await self._write_staged()
+    except Exception:
+      logger.exception("Failed to write persistence data")
+
+  async def _write_staged(self):
+    async with self._write_lock:
+      user_data, self._staged_user_data = self._staged_user_data, {}
+      chat_data, self._staged_chat_data = self._staged_chat_data, {}
+      conversations, self._staged_conversations = self._staged_conversations, {}
+      if not (user_data or chat_data or conversations):
+        return
+
+      async with AsyncDBSession() as db_session, db_session.begin():
+        if user_data:
+          await db_session.execute(
+            delete(PersistedUserData).where(PersistedUserData.user_id.in_(user_data))
+          )
+          rows = [
+            {"user_id": user_id, "data": pickle.dumps(data)}
+            for user_id, data in user_data.items() if data is not None
+          ]
+          if rows:
+            await db_session.execute(insert(PersistedUserData), rows)
+
+        if chat_data:
+          await db_session.execute(
+            delete(PersistedChatData).where(PersistedChatData.chat_id.in_(chat_data))
+          )
+          rows = [
+            {"chat_id": chat_id, "data": pickle.dumps(data)}
+            for chat_id, data in chat_data.items() if data is not None
+          ]
+          if rows:
+            await db_session.execute(insert(PersistedChatData), rows)
+
+        if conversations:
+          await db_session.execute(
+            delete(PersistedConversation).where(
+              tuple_(PersistedConversation.name, PersistedConversation.key).in_(conversations)
+            )
+          )
+          # conversations that ended have no state and are simply removed
+          rows = [
+            {"name": name, "key": key, "state": pickle.dumps(state)}
+            for (name, key), state in conversations.items() if state is not None
+          ]
+          if rows:
+            await db_session.execute(insert(PersistedConversation), rows)
+
+      logger.debug(
+        f"Persisted {len(user_data)} user(s), {len(chat_data)} chat(s) "
+        f"and {len(conversations)} conversation(s)"
+      )
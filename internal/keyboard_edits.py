@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import Application
+
+# Coalesces inline keyboard edits per notification message.
+# Edits are queued instead of sent immediately. After EDIT_DEBOUNCE_SECONDS,
+# only the latest queued markup for each message is sent, and only if it
+# differs from the markup that message last received. Rapid clicks through
+# several request states therefore cost a single edit per message.
+# In sharded mode, workers edit each other's messages, so a worker cannot know
+# the markup a message last received and sends every coalesced edit.
+
+EDIT_DEBOUNCE_SECONDS = 0.5
+MAX_TRACKED_MESSAGES = 10000
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, message_id) -> markup last sent to Telegram, least recently used first
+_last_sent = OrderedDict()
+# (chat_id, message_id) -> markup waiting to be sent
+_queued = {}
+# (chat_id, message_id) -> task sending queued markups for that message
+_senders = {}
+_track_sent_markups = True
+
+def disable_sent_markup_tracking():
+  global _track_sent_markups
+  _track_sent_markups = False
+  _last_sent.clear()
+
+def record_sent_markup(chat_id: int, message_id: int, reply_markup: InlineKeyboardMarkup):
+  if not _track_sent_markups:
+    return
+  key = (chat_id, message_id)
+  _last_sent[key] = reply_markup
+  _last_sent.move_to_end(key)
+  if len(_last_sent) > MAX_TRACKED_MESSAGES:
+    _last_sent.popitem(last=False)
+
+def queue_reply_markup_edit(
+  app: Application,
+  chat_id: int,
+  message_id: int,
+  reply_markup: InlineKeyboardMarkup,
+):
+  """
+  Queues an `edit_message_reply_markup` call that supersedes any edit still
+  queued for the same message. Returns immediately.
+  """
+  key = (chat_id, message_id)
+  _queued[key] = reply_markup
+  if key not in _senders:
+    _senders[key] = app.create_task(send_queued_edits(app, key))
+
+async def send_queued_edits(app: Application, key):
+  chat_id, message_id = key
+  try:
+    while key in _queued:
+      await asyncio.sleep(EDIT_DEBOUNCE_SECONDS)
+      reply_markup = _queued.pop(key)
+      if _last_sent.get(key) == reply_markup:
+        continue
+
+      try:
+        await app.bot.edit_message_reply_markup(
+          chat_id=chat_id,
+          message_id=message_id,
+          reply_markup=reply_markup,
+        )
+      except BadRequest as err:
+        if "not modified" not in err.message.lower():
+          logger.error(f"Failed to edit keyboard of message {message_id} in chat {chat_id}: {err}")
+          continue
+      except TelegramError as err:
+        logger.error(f"Failed to edit keyboard of message {message_id} in chat {chat_id}: {err}")
+        continue
+      record_sent_markup(chat_id, message_id, reply_markup)
+  finally:
+    del _senders[key]
@@ -0,0 +1,141 @@
+import functools
+import time
+from telegram.ext import Application, ConversationHandler
+from telegram.request import HTTPXRequest
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+from db.query_log import statement_observers
+
+# Prometheus metrics for handlers, Bot API calls and the database, served in
+# the text exposition format on a local HTTP endpoint (see `start_metrics_server`).
+# Handlers are instrumented by wrapping their callbacks after registration, and
+# Bot API calls by the request object given to the Application, so neither
+# needs any code in the handlers themselves.
+
+HANDLER_DURATION = Histogram(
+  "sdo_bot_handler_duration_seconds",
+  "Time taken by handler callbacks, by handler and outcome.",
+  ["handler", "outcome"],
+)
+TELEGRAM_CALL_DURATION = Histogram(
+  "sdo_bot_telegram_call_duration_seconds",
+  "Time taken by Bot API calls, by endpoint and outcome (ok or the error raised).",
+  ["endpoint", "outcome"],
+)
+DB_STATEMENT_DURATION = Histogram(
+  "sdo_bot_db_statement_duration_seconds",
+  "Time taken to execute SQL statements, by statement type.",
+  ["statement"],
+  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_STATEMENTS_PER_UPDATE = Histogram(
+  "sdo_bot_db_statements_per_update",
+  "Number of SQL statements executed while handling an update.",
+  buckets=(0, 1, 2, 3, 5, 8, 13, 20, 30, 50, 100),
+)
+REQUESTS_SUBMITTED = Counter(
+  "sdo_bot_requests_submitted_total",
+  "Requests submitted by trainees, by request type.",
+  ["request_type"],
+)
+
+def get_callback_name(callback) -> str:
+  return f"{callback.__module__}.{callback.__qualname__}"
+
+def instrument_callback(callback, name: str):
+  """Wraps a handler callback to record its duration and outcome as `name`."""
+  ok_duration = HANDLER_DURATION.labels(name, "ok")
+  error_duration = HANDLER_DURATION.labels(name, "error")
+
+  @functools.wraps(callback)
+  async def instrumented_callback(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+      result = await callback(*args, **kwargs)
+    except BaseException:
+      error_duration.observe(time.perf_counter() - start)
+      raise
+    ok_duration.observe(time.perf_counter() - start)
+    return result
+
+  instrumented_callback.is_instrumented = True
+  return instrumented_callback
+
+def instrument_handler(handler):
+  if isinstance(handler, ConversationHandler):
+    for state_handlers in (handler.entry_points, *handler.states.values(), handler.fallbacks):
+      for nested_handler in state_handlers:
+        instrument_handler(nested_handler)
+    return
+
+  if not getattr(handler.callback, "is_instrumented", False):
+    handler.callback = instrument_callback(handler.callback, get_callback_name(handler.callback))
+
+def instrument_handlers(app: Application):
+  """Instruments every handler registered so far. Call after all handlers are added."""
+  for handlers in app.handlers.values():
+    for handler in handlers:
+      instrument_handler(handler)
+
+def instrument_dispatch_table(callbacks: dict):
+  """Instruments callbacks that a handler dispatches to through a dict, in place."""
+  for key, callback in callbacks.items():
+    if not getattr(callback, "is_instrumented", False):
+      callbacks[key] = instrument_callback(callback, get_callback_name(callback))
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+  """HTTPXRequest that records the duration and outcome of every Bot API call."""
+
+  async def post(self, url: str, *args, **kwargs):
+    endpoint = url.rsplit("/", 1)[-1]
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+      return await super().post(url, *args, **kwargs)
+    except BaseException as err:
+      outcome = type(err).__name__
+      raise
+    finally:
+      TELEGRAM_CALL_DURATION.labels(endpoint, outcome).observe(time.perf_counter() - start)
+
+def observe_statement(statement: str, duration: float):
+  DB_STATEMENT_DURATION.labels(statement.split(None, 1)[0].upper()).observe(duration)
+
+def instrument_db():
+  """Records statement timings reported by `db.query_log`."""
+  if observe_statement not in statement_observers:
+    statement_observers.append(observe_statement)
+
+class OutboundSchedulerCollector:
+  def __init__(self):
+    self.scheduler = None
+
+  def collect(self):
+    queue_depth = GaugeMetricFamily(
+      "sdo_bot_outbound_queue_depth",
+      "Bot API calls waiting in the outbound scheduler, by priority.",
+      labels=["priority"],
+    )
+    retry_after = CounterMetricFamily(
+      "sdo_bot_outbound_retry_after",
+      "Bot API calls rejected by flood control and retried by the outbound scheduler.",
+    )
+    if self.scheduler is not None:
+      for priority, depth in self.scheduler.get_queue_depths().items():
+        queue_depth.add_metric([priority], depth)
+      retry_after.add_metric([], self.scheduler.retry_after_count)
+    yield queue_depth
+    yield retry_after
+
+outbound_scheduler_collector = OutboundSchedulerCollector()
+REGISTRY.register(outbound_scheduler_collector)
+
+def track_outbound_scheduler(scheduler):
+  outbound_scheduler_collector.scheduler = scheduler
+
+DEFAULT_METRICS_PORT = 9100
+
+def start_metrics_server(port: int = DEFAULT_METRICS_PORT, addr: str = "127.0.0.1"):
+  """Serves /metrics from a background thread. Binds to localhost unless told otherwise."""
+  start_http_server(port, addr)
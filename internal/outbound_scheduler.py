@@ -0,0 +1,219 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utility.constants import OutboundPriority
+
+# Every Bot API call made through `context.bot` passes through the scheduler
+# installed on the Application (see `ApplicationBuilder.rate_limiter`).
+# Calls addressed to a chat are queued by priority and released when both the
+# global and that chat's token bucket allow, which keeps the bot under
+# Telegram's flood limits. RetryAfter errors pause all sending and the call is
+# retried, so handlers never see them unless retries are exhausted.
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+  def __init__(self, rate: float, capacity: float):
+    self.rate = rate
+    self.capacity = capacity
+    self.tokens = capacity
+    self.updated = time.monotonic()
+
+  def refill(self, now: float):
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def time_until_available(self, now: float) -> float:
+    self.refill(now)
+    return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+  def consume(self):
+    self.tokens -= 1
+
+class PendingCall:
+  __slots__ = ("priority", "seq", "chat_id", "granted")
+
+  def __init__(self, priority: int, seq: int, chat_id):
+    self.priority = priority
+    self.seq = seq
+    self.chat_id = chat_id
+    self.granted = asyncio.get_running_loop().create_future()
+
+  def __lt__(self, other: "PendingCall"):
+    return (self.priority, self.seq) < (other.priority, other.seq)
+
+def is_private_chat(chat_id):
+  return isinstance(chat_id, int) and chat_id > 0
+
+def classify(endpoint: str, data: dict) -> OutboundPriority:
+  if endpoint.startswith("edit"):
+    return OutboundPriority.KEYBOARD_EDIT
+  elif is_private_chat(data.get("chat_id")):
+    return OutboundPriority.PRIVATE_CHAT
+  return OutboundPriority.GROUP_CHAT
+
+class OutboundScheduler(BaseRateLimiter[OutboundPriority]):
+  """
+  Rate limiter that schedules outgoing Bot API calls by priority.
+  The default limits follow https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+  Pass an `OutboundPriority` as `rate_limit_args` to a bot method to override
+  the priority derived from the endpoint and chat.
+  When several processes send as the same bot, each is given a `share` of the
+  overall and group chat limits.
+  """
+
+  def __init__(
+    self,
+    overall_rate: float = 30,
+    private_chat_rate: float = 1,
+    private_chat_burst: float = 3,
+    group_chat_rate: float = 20 / 60,
+    group_chat_burst: float = 5,
+    max_retries: int = 3,
+    share: float = 1,
+  ):
+    # private chats are not shared, since nearly all of a private chat's
+    # messages are sent by the process its updates are sharded to
+    overall_rate *= share
+    self.private_chat_rate = private_chat_rate
+    self.private_chat_burst = private_chat_burst
+    self.group_chat_rate = group_chat_rate * share
+    self.group_chat_burst = max(1, group_chat_burst * share)
+    self.max_retries = max_retries
+
+    self._overall_bucket = TokenBucket(overall_rate, overall_rate)
+    self._chat_buckets = {}
+    self._pending = []
+    self._seq = itertools.count()
+    self._paused_until = 0
+    self._wakeup = None
+    self._dispatcher = None
+
+    self.retry_after_count = 0
+
+  async def initialize(self):
+    if self._dispatcher is None:
+      self._wakeup = asyncio.Event()
+      self._dispatcher = asyncio.create_task(self._dispatch())
+
+  async def shutdown(self):
+    if self._dispatcher is not None:
+      self._dispatcher.cancel()
+      try:
+        await self._dispatcher
+      except asyncio.CancelledError:
+        pass
+      self._dispatcher = None
+
+  def get_queue_depths(self) -> dict:
+    """Number of calls waiting to be sent, by priority name."""
+    depths = {priority.name: 0 for priority in OutboundPriority}
+    for pending_call in self._pending:
+      depths[OutboundPriority(pending_call.priority).name] += 1
+    return depths
+
+  def _get_chat_bucket(self, chat_id) -> TokenBucket:
+    bucket = self._chat_buckets.get(chat_id)
+    if bucket is None:
+      if is_private_chat(chat_id):
+        bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst)
+      else:
+        bucket = TokenBucket(self.group_chat_rate, self.group_chat_burst)
+      self._chat_buckets[chat_id] = bucket
+    return bucket
+
+  def _forget_idle_chats(self, now: float):
+    # a full bucket behaves exactly like a new one, so it can be dropped
+    for chat_id, bucket in list(self._chat_buckets.items()):
+      bucket.refill(now)
+      if bucket.tokens >= bucket.capacity:
+        del self._chat_buckets[chat_id]
+
+  def _grant_eligible_calls(self, now: float):
+    """Grants calls in priority order. Returns how long to wait before trying again."""
+    if now < self._paused_until:
+      return self._paused_until - now
+
+    wait = None
+    for pending_call in list(self._pending):
+      if pending_call.granted.done():
+        # caller was cancelled
+        self._pending.remove(pending_call)
+        continue
+
+      overall_wait = self._overall_bucket.time_until_available(now)
+      if overall_wait > 0:
+        return overall_wait
+
+      chat_bucket = self._get_chat_bucket(pending_call.chat_id)
+      chat_wait = chat_bucket.time_until_available(now)
+      if chat_wait > 0:
+        # skip to calls for other chats instead of blocking them
+        wait = chat_wait if wait is None else min(wait, chat_wait)
+        continue
+
+      self._overall_bucket.consume()
+      chat_bucket.consume()
+      self._pending.remove(pending_call)
+      pending_call.granted.set_result(None)
+
+    return wait
+
+  async def _dispatch(self):
+    while True:
+      now = time.monotonic()
+      try:
+        wait = self._grant_eligible_calls(now)
+        if len(self._chat_buckets) > 1000:
+          self._forget_idle_chats(now)
+      except Exception:
+        logger.exception("Outbound scheduler failed to dispatch calls")
+        wait = 1
+
+      self._wakeup.clear()
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), wait)
+      except asyncio.TimeoutError:
+        pass
+
+  async def _wait_for_turn(self, priority: int, seq: int, chat_id):
+    await self.initialize()
+    pending_call = PendingCall(priority, seq, chat_id)
+    bisect.insort(self._pending, pending_call)
+    self._wakeup.set()
+    try:
+      await pending_call.granted
+    except asyncio.CancelledError:
+      pending_call.granted.cancel()
+      raise
+
+  async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+    chat_id = data.get("chat_id")
+    priority = rate_limit_args if rate_limit_args is not None else classify(endpoint, data)
+    # retries keep their place in the queue
+    seq = next(self._seq)
+
+    for attempt in range(self.max_retries + 1):
+      if chat_id is None:
+        # not subject to per-chat limits (e.g. answerCallbackQuery), but
+        # still held back while flood control is in effect
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+          await asyncio.sleep(pause)
+      else:
+        await self._wait_for_turn(priority, seq, chat_id)
+
+      try:
+        return await callback(*args, **kwargs)
+      except RetryAfter as err:
+        self.retry_after_count += 1
+        if attempt == self.max_retries:
+          raise
+
+        logger.warning(f"Flood limit hit by {endpoint} to chat {chat_id}. Retrying in {err.retry_after}s.")
+        self._paused_until = max(self._paused_until, time.monotonic() + err.retry_after)
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+
+from db import AsyncDBSession
+from db.archive import archive_batch
+
+# Background task that periodically moves finished requests older than
+# `max_age_days` into the archive tables (see db/archive.py), so that the tables
+# queried by handlers only hold recent and unfinished requests.
+# Batches are archived one transaction at a time, with a pause in between so
+# that handlers waiting to write are not held up.
+
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_INTERVAL = 60 * 60
+DEFAULT_BATCH_SIZE = 200
+BATCH_PAUSE = 0.1
+
+logger = logging.getLogger(__name__)
+
+_archival_task = None
+
+async def archive_finished_requests(max_age_days: float, batch_size: int) -> int:
+  cutoff = time.time() - max_age_days * 24 * 60 * 60
+  total_archived = 0
+  while True:
+    async with AsyncDBSession() as db_session, db_session.begin():
+      archived = await archive_batch(db_session, cutoff, batch_size)
+    total_archived += archived
+    if archived < batch_size:
+      return total_archived
+    await asyncio.sleep(BATCH_PAUSE)
+
+async def run_archival(max_age_days: float, interval: float, batch_size: int):
+  while True:
+    try:
+      archived = await archive_finished_requests(max_age_days, batch_size)
+      if archived:
+        logger.info(f"Archived {archived} finished request(s)")
+    except Exception:
+      logger.exception("Failed to archive finished requests")
+    await asyncio.sleep(interval)
+
+def start_archival(
+  enabled: bool = True,
+  max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+  interval: float = DEFAULT_INTERVAL,
+  batch_size: int = DEFAULT_BATCH_SIZE,
+):
+  global _archival_task
+  if enabled and _archival_task is None:
+    _archival_task = asyncio.create_task(run_archival(max_age_days, interval, batch_size))
+
+async def stop_archival():
+  global _archival_task
+  if _archival_task is not None:
+    _archival_task.cancel()
+    try:
+      await _archival_task
+    except asyncio.CancelledError:
+      pass
+    _archival_task = None
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+from typing import Awaitable, Callable, Dict
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+
+from utility.callback_data import get_callback_request_id
+
+# Deployment mode for more than one CPU core: one ingester process receives
+# updates (by polling or webhook) and hands them to worker processes over local
+# queues. Each worker runs the normal Application with all feature handlers,
+# and the workers share state only through the database.
+#
+# Updates are sharded by chat. Conversations are keyed by chat and user, and a
+# private chat has its user's ID, so a conversation, its chat_data and the
+# user_data of a trainee filling in a form always stay on one worker, where
+# they are handled in order (see internal/update_processor.py).
+# Presses of buttons on request notifications are sharded by request instead,
+# since every SDO group has a notification of each request. All presses on a
+# request, and so the keyboard edits they make, stay in one worker and its
+# edit queue.
+#
+# Each worker still has its own outbound scheduler. Private chat limits are
+# applied by each worker on its own, so messages to a trainee from different
+# workers (e.g. the reply to their own update and a verdict) may exceed the
+# limit together and are not ordered with each other. Keyboard edits made by
+# /approve come from the worker of the group it was sent in, so they are not
+# ordered with a concurrent press on the same request.
+#
+# Other in-process state is kept in step by broadcasts: a worker calls
+# `broadcast(name)`, and the ingester relays it to every other worker, which
+# runs the handler registered with `on_broadcast(name, handler)`.
+
+logger = logging.getLogger(__name__)
+
+WORKER_START_TIMEOUT = 60
+
+# name -> async function called with the Application when another worker broadcasts the name
+broadcast_handlers: Dict[str, Callable[[Application], Awaitable]] = {}
+
+# set in worker processes only
+_event_queue = None
+_worker_index = None
+
+def on_broadcast(name: str, handler: Callable[[Application], Awaitable]):
+  broadcast_handlers[name] = handler
+
+def broadcast(name: str):
+  """Has every other worker process run the handler for `name`. Does nothing outside sharded mode."""
+  if _event_queue is not None:
+    _event_queue.put(("broadcast", _worker_index, name))
+
+def get_shard(update: Update, worker_count: int) -> int:
+  if update.callback_query is not None:
+    request_id = get_callback_request_id(update.callback_query.data)
+    if request_id is not None:
+      return request_id % worker_count
+  if update.effective_chat is not None:
+    return update.effective_chat.id % worker_count
+  elif update.effective_user is not None:
+    return update.effective_user.id % worker_count
+  return update.update_id % worker_count
+
+def owns_user(worker_index: int, worker_count: int, user_id: int) -> bool:
+  """Whether the worker handles the user's private chat, and so owns their user_data."""
+  return user_id % worker_count == worker_index
+
+def run_worker(build_worker_application, bot_config, worker_index, worker_count, update_queue, event_queue):
+  # the ingester handles Ctrl+C and stops the workers through their queues
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+  global _event_queue, _worker_index
+  _event_queue = event_queue
+  _worker_index = worker_index
+
+  app = build_worker_application(bot_config, worker_index, worker_count)
+  asyncio.run(process_worker_queue(app, update_queue, event_queue, worker_index))
+
+async def process_worker_queue(app: Application, update_queue, event_queue, worker_index: int):
+  loop = asyncio.get_running_loop()
+  async with app:
+    if app.post_init is not None:
+      await app.post_init(app)
+    await app.start()
+    event_queue.put(("ready", worker_index, None))
+
+    while True:
+      message = await loop.run_in_executor(None, update_queue.get)
+      if message is None:
+        break
+
+      kind, payload = message
+      if kind == "update":
+        await app.update_queue.put(Update.de_json(payload, app.bot))
+      else:
+        app.create_task(broadcast_handlers[payload](app))
+
+    await app.stop()
+    if app.post_stop is not None:
+      await app.post_stop(app)
+
+class WorkerPool:
+  def __init__(self, build_worker_application, bot_config: dict, worker_count: int):
+    # workers must not inherit the ingester's DB connections and event loop
+    context = multiprocessing.get_context("spawn")
+    self.worker_count = worker_count
+    self._update_queues = [context.Queue() for _ in range(worker_count)]
+    self._event_queue = context.Queue()
+    self._processes = [
+      context.Process(
+        target=run_worker,
+        args=(build_worker_application, bot_config, index, worker_count, self._update_queues[index], self._event_queue),
+        name=f"worker-{index}",
+      )
+      for index in range(worker_count)
+    ]
+
+  def start(self):
+    """Starts the workers and waits until all of them can take updates."""
+    for process in self._processes:
+      process.start()
+
+    not_ready = set(range(self.worker_count))
+    waited = 0
+    while not_ready:
+      try:
+        kind, worker_index, _ = self._event_queue.get(timeout=1)
+      except queue.Empty:
+        waited += 1
+        if waited >= WORKER_START_TIMEOUT or not all(process.is_alive() for process in self._processes):
+          self.stop()
+          raise RuntimeError("Worker processes failed to start")
+        continue
+      if kind == "ready":
+        not_ready.discard(worker_index)
+    logger.info(f"Started {self.worker_count} worker processes")
+
+  def submit(self, update: Update):
+    self._update_queues[get_shard(update, self.worker_count)].put(("update", update.to_dict()))
+
+  async def relay_broadcasts(self):
+    """Relays broadcasts between the workers until `stop` is called."""
+    loop = asyncio.get_running_loop()
+    while True:
+      event = await loop.run_in_executor(None, self._event_queue.get)
+      if event is None:
+        return
+
+      kind, sender_index, name = event
+      if kind != "broadcast":
+        continue
+      for index, update_queue in enumerate(self._update_queues):
+        if index != sender_index:
+          update_queue.put(("broadcast", name))
+
+  def stop(self):
+    """Lets the workers finish the updates already submitted, then waits for them to exit."""
+    for update_queue in self._update_queues:
+      update_queue.put(None)
+    self._event_queue.put(None)
+    for process in self._processes:
+      if process.is_alive():
+        process.join()
+
+async def run_ingester(bot_config: dict, pool: WorkerPool, stop_event: asyncio.Event):
+  """Receives updates and submits them to `pool` until `stop_event` is set."""
+  bot = Bot(bot_config["bot_token"], base_url=bot_config.get("base_url", "https://api.telegram.org/bot"))
+  updater = Updater(bot, asyncio.Queue())
+
+  async def forward_updates():
+    while True:
+      update = await updater.update_queue.get()
+      if update is None:
+        return
+      pool.submit(update)
+
+  async with updater:
+    webhook_options = bot_config.get("webhook")
+    if webhook_options is None:
+      await updater.start_polling(timeout=10, poll_interval=0)
+    else:
+      await updater.start_webhook(**webhook_options)
+    forward_task = asyncio.create_task(forward_updates())
+
+    await stop_event.wait()
+    await updater.stop()
+    await updater.update_queue.put(None)
+    await forward_task
+
+def run_sharded(bot_config: dict, build_worker_application):
+  """
+  Runs the bot with `bot_config["workers"]` worker processes until interrupted.
+  `build_worker_application(bot_config, worker_index, worker_count)` is called
+  in each worker and must be importable by name from a new process.
+  """
+  pool = WorkerPool(build_worker_application, bot_config, bot_config["workers"])
+  pool.start()
+
+  async def run():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+      loop.add_signal_handler(signal_number, stop_event.set)
+    relay_task = asyncio.create_task(pool.relay_broadcasts())
+    await run_ingester(bot_config, pool, stop_event)
+    # stopping the pool also ends the relay
+    await loop.run_in_executor(None, pool.stop)
+    await relay_task
+
+  asyncio.run(run())
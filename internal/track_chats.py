@@ -2,8 +2,7 @@ import logging
 from telegram import Update, ChatMember, Chat
 from telegram.ext import Application, ContextTypes, ChatMemberHandler
 
-from sqlalchemy.orm import Session as DBSession
-from db import engine
+from db import AsyncDBSession
 from db.classes import ChatGroup
 
 # TODO: in production, DISABLE ADDING BOT TO GROUPS after adding it to official groups!
@@ -40,15 +39,15 @@ async def on_membership_update(update: Update, context: ContextTypes.DEFAULT_TYP
   if not was_member ^ is_member:
     return
 
-  with DBSession(engine) as db_session, db_session.begin():
+  async with AsyncDBSession() as db_session, db_session.begin():
     if is_member and not was_member:
       logger.info(f"Bot joined group ID {chat.id}")
       newly_joined_group = ChatGroup(id=chat.id)
       db_session.add(newly_joined_group)
     elif was_member and not is_member:
       logger.info(f"Bot removed from group ID {chat.id}")
-      left_group = db_session.get(ChatGroup, chat.id)
-      db_session.delete(left_group)
+      left_group = await db_session.get(ChatGroup, chat.id)
+      await db_session.delete(left_group)
 
 def track_chats(app: Application):
   app.add_handler(ChatMemberHandler(on_membership_update, ChatMemberHandler.MY_CHAT_MEMBER))
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utility.callback_data import get_callback_request_id
+from db.query_log import StatementStats, current_statement_stats, log_update_statements
+from internal.metrics import DB_STATEMENTS_PER_UPDATE
+
+# Processes updates concurrently, except that updates from the same user or in
+# the same chat are handled one at a time, in the order they arrived. Handlers
+# written for sequential processing (ConversationHandler state machines, the
+# HOTO flow) therefore still see each user's and chat's updates in order, while
+# one slow handler no longer holds up everyone else.
+# Presses of buttons on the same request are also handled one at a time, even
+# from different SDO groups, so that their keyboard edits are queued in order.
+#
+# Every update waits for the last earlier update sharing any of its keys. Each
+# update task registers itself before its first await, and the Application
+# starts update tasks in arrival order, so the wait order matches arrival.
+#
+# Also counts the SQL statements run for each update (see db/query_log.py).
+# Statements run by tasks that a handler starts are counted too, since tasks
+# inherit the context they were created in.
+
+DEFAULT_MAX_CONCURRENT_UPDATES = 32
+MAX_PENDING_UPDATES = 4096
+
+def describe_update(update: object) -> str:
+  if not isinstance(update, Update):
+    return type(update).__name__
+  elif update.callback_query is not None:
+    return f"Callback query (update {update.update_id})"
+
+  # only the command is included, since message text may be personal
+  message = update.effective_message
+  if message is not None and message.text is not None and message.text.startswith("/"):
+    return f"{message.text.split(None, 1)[0]} (update {update.update_id})"
+  return f"Update {update.update_id}"
+
+def get_ordering_keys(update: object) -> tuple:
+  if not isinstance(update, Update):
+    return ()
+
+  keys = []
+  if update.effective_chat is not None:
+    keys.append(("chat", update.effective_chat.id))
+  if update.effective_user is not None:
+    keys.append(("user", update.effective_user.id))
+  if update.callback_query is not None:
+    request_id = get_callback_request_id(update.callback_query.data)
+    if request_id is not None:
+      keys.append(("request", request_id))
+  return tuple(keys)
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+  def __init__(self, max_concurrent_updates: int = DEFAULT_MAX_CONCURRENT_UPDATES):
+    # The base class limits how many update tasks may exist at once. Handlers
+    # are limited separately, only once it is their turn, so that a burst of
+    # updates from one user cannot take every slot while queued behind itself.
+    super().__init__(max_concurrent_updates=MAX_PENDING_UPDATES)
+    self._handler_slots = asyncio.Semaphore(max_concurrent_updates)
+    # ordering key -> future completed when the last update with that key is done
+    self._last_updates = {}
+
+  async def do_process_update(self, update: object, coroutine: Awaitable):
+    keys = get_ordering_keys(update)
+    predecessors = {self._last_updates[key] for key in keys if key in self._last_updates}
+    done = asyncio.get_running_loop().create_future()
+    for key in keys:
+      self._last_updates[key] = done
+
+    try:
+      if predecessors:
+        # asyncio.wait, unlike awaiting the futures, does not cancel them if
+        # this task is cancelled
+        await asyncio.wait(predecessors)
+      async with self._handler_slots:
+        await self._process_counting_statements(update, coroutine)
+    finally:
+      done.set_result(None)
+      for key in keys:
+        if self._last_updates.get(key) is done:
+          del self._last_updates[key]
+
+  async def _process_counting_statements(self, update: object, coroutine: Awaitable):
+    stats = StatementStats()
+    token = current_statement_stats.set(stats)
+    try:
+      await coroutine
+    finally:
+      current_statement_stats.reset(token)
+      DB_STATEMENTS_PER_UPDATE.observe(stats.count)
+      log_update_statements(describe_update(update), stats)
+
+  async def initialize(self):
+    pass
+
+  async def shutdown(self):
+    pass
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from telegram import Update
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import Application, ContextTypes, TypeHandler
+from typing import Optional
+
+from utility.ttl_cache import TTLCache
+
+from db import AsyncDBSession, ReadOnlyDBSession
+from db.classes import UserProfile
+
+# Usernames of users who interact with the bot, so that they can be looked up
+# locally instead of with a get_chat call.
+# Profiles are recorded from every incoming update. Lookups are served from
+# memory, then from the UserProfile table, and only fall back to get_chat for
+# users the bot has never seen. Stale profiles are served immediately and
+# refreshed in the background, with at most one get_chat per user at a time.
+# Only a user that Telegram reports as not found is cached as having no
+# username; on other errors, e.g. timeouts, the known profile is kept and
+# fetched again on a later lookup.
+
+PROFILE_CACHE_SIZE = 10000
+PROFILE_TTL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+profile_cache = TTLCache(max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_TTL)
+
+# get_chat calls in progress, by user ID
+fetches_in_progress = {}
+
+async def save_profile(user_id: int, username: Optional[str]):
+  async with AsyncDBSession() as db_session, db_session.begin():
+    await db_session.merge(UserProfile(id=user_id, username=username, updated_at=time.time()))
+
+async def fetch_profile(app: Application, user_id: int) -> Optional[str]:
+  try:
+    username = (await app.bot.get_chat(user_id)).username
+  except BadRequest as err:
+    # No user with that ID. Account was probably deleted.
+    # Cache the miss anyway so that the lookup is not repeated on every call.
+    logger.warning(f"Could not fetch profile of user ID {user_id}: {err}")
+    profile_cache.set(user_id, None)
+    return None
+  except TelegramError as err:
+    # e.g. a network error or flood limit, so the profile is retried later
+    logger.warning(f"Could not fetch profile of user ID {user_id}, keeping the known one: {err}")
+    cached = profile_cache.get(user_id)
+    return cached.value if cached is not None else None
+
+  profile_cache.set(user_id, username)
+  await save_profile(user_id, username)
+  return username
+
+def start_fetch(app: Application, user_id: int) -> asyncio.Task:
+  """Starts fetch_profile for the user, unless it is already in progress. Returns its task."""
+  task = fetches_in_progress.get(user_id)
+  if task is None:
+    task = app.create_task(fetch_profile(app, user_id))
+    fetches_in_progress[user_id] = task
+    task.add_done_callback(lambda _: fetches_in_progress.pop(user_id, None))
+  return task
+
+async def get_username(app: Application, user_id: int) -> Optional[str]:
+  """
+  Returns the username of the given user, or None if they have no username
+  or the account no longer exists.
+  """
+  cached = profile_cache.get(user_id)
+  if cached is not None:
+    if not cached.is_fresh:
+      start_fetch(app, user_id)
+    return cached.value
+
+  async with ReadOnlyDBSession() as db_session:
+    profile = await db_session.get(UserProfile, user_id)
+
+  if profile is None:
+    # shielded, since other lookups may be waiting for the same fetch
+    return await asyncio.shield(start_fetch(app, user_id))
+
+  profile_cache.set(user_id, profile.username)
+  if time.time() - profile.updated_at >= PROFILE_TTL:
+    start_fetch(app, user_id)
+  return profile.username
+
+async def record_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+  user = update.effective_user
+  if user is None:
+    return
+
+  cached = profile_cache.get(user.id)
+  if cached is not None and cached.is_fresh and cached.value == user.username:
+    return
+
+  profile_cache.set(user.id, user.username)
+  context.application.create_task(save_profile(user.id, user.username))
+
+def track_user_profiles(app: Application):
+  # group -1 runs before every feature handler
+  app.add_handler(TypeHandler(Update, record_profile), group=-1)
@@ -1,11 +1,22 @@
 import logging
-import json
+from functools import partial
+from typing import Optional
 from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
 
 import features
 from internal.track_chats import track_chats
+from internal.user_profiles import track_user_profiles
+from internal.outbound_scheduler import OutboundScheduler
+from internal.db_persistence import DBPersistence
+from internal.update_processor import OrderedUpdateProcessor, DEFAULT_MAX_CONCURRENT_UPDATES
+from internal.metrics import InstrumentedHTTPXRequest, instrument_handlers, instrument_dispatch_table, instrument_db, \
+                             track_outbound_scheduler, start_metrics_server, DEFAULT_METRICS_PORT
+from internal.sharding import owns_user, run_sharded
+from internal.keyboard_edits import disable_sent_markup_tracking
+from internal.request_archival import start_archival, stop_archival
 from utility.constants import HELP_MESSAGE
+from utility.bot_config import get_bot_config
 
 logging.basicConfig(
   format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -25,11 +36,47 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def help(update: Update, context: ContextTypes.DEFAULT_TYPE):
   await update.message.reply_text(HELP_MESSAGE)
 
-if __name__ == "__main__":
-  with open("bot_config.json") as bot_config_file:
-    bot_config = json.load(bot_config_file)
+async def post_init(app: Application, archival_options: Optional[dict]):
+  await features.sdo.load_roster(app)
+  if archival_options is not None:
+    start_archival(**archival_options)
+
+async def post_stop(app: Application):
+  await stop_archival()
+
+def build_application(bot_config: dict, worker_index: int = 0, worker_count: int = 1) -> Application:
+  """
+  Builds the bot's Application. In sharded mode (see internal/sharding.py),
+  builds the Application of the worker with the given index, which receives
+  updates from the ingester instead of fetching them itself.
+  """
+  outbound_scheduler = OutboundScheduler(**bot_config.get("outbound_scheduler", {}), share=1 / worker_count)
+  persistence = DBPersistence(
+    update_interval=bot_config.get("persistence_update_interval", 60),
+    owns_user=partial(owns_user, worker_index, worker_count) if worker_count > 1 else None,
+  )
+  # in sharded mode, only the first worker archives requests
+  archival_options = bot_config.get("archival", {}) if worker_index == 0 else None
+  builder = ApplicationBuilder() \
+    .token(bot_config["bot_token"]) \
+    .post_init(partial(post_init, archival_options=archival_options)) \
+    .post_stop(post_stop) \
+    .request(InstrumentedHTTPXRequest(connection_pool_size=256)) \
+    .rate_limiter(outbound_scheduler) \
+    .concurrent_updates(OrderedUpdateProcessor(
+      bot_config.get("max_concurrent_updates", DEFAULT_MAX_CONCURRENT_UPDATES),
+    )) \
+    .persistence(persistence)
 
-  app = ApplicationBuilder().token(bot_config["bot_token"]).build()
+  # allows pointing the bot at a self-hosted or fake Bot API server
+  if "base_url" in bot_config:
+    builder = builder.base_url(bot_config["base_url"])
+  if worker_count > 1:
+    builder = builder.updater(None)
+    # other workers edit the same notification messages
+    disable_sent_markup_tracking()
+
+  app = builder.build()
 
   app.add_handler(CommandHandler("start", start))
   app.add_handler(CommandHandler("help", help))
@@ -42,8 +89,62 @@ if __name__ == "__main__":
   features.sdo.init(app)
   features.enquiry.init(app)
   features.send_message_to_requestor.init(app)
+  features.export.init(app)
+  features.parade_state.init(app)
+  features.search.init(app)
+  features.pending.init(app)
+  features.bulk_approve.init(app)
 
   # internal stuff
   track_chats(app)
+  track_user_profiles(app)
+
+  # metrics
+  instrument_handlers(app)
+  instrument_dispatch_table(features.shared.callbacks.callback_handlers)
+  instrument_db()
+  track_outbound_scheduler(outbound_scheduler)
+
+  return app
+
+def get_webhook_options(bot_config: dict) -> dict:
+  """
+  Returns keyword arguments for `Application.run_webhook` and
+  `Updater.start_webhook`, or None if webhook mode is not configured.
+  """
+  webhook_options = bot_config.get("webhook")
+  if webhook_options is None:
+    return None
+
+  # without a secret token, anyone who learns the URL can forge updates
+  if not webhook_options.get("secret_token"):
+    raise ValueError("webhook.secret_token must be set in bot_config.json")
+
+  return webhook_options
+
+def build_worker_application(bot_config: dict, worker_index: int, worker_count: int) -> Application:
+  # each worker serves its own metrics, on consecutive ports
+  if "metrics" in bot_config:
+    metrics_options = bot_config["metrics"]
+    start_metrics_server(**{
+      **metrics_options,
+      "port": metrics_options.get("port", DEFAULT_METRICS_PORT) + worker_index,
+    })
+  return build_application(bot_config, worker_index, worker_count)
+
+if __name__ == "__main__":
+  bot_config = get_bot_config()
+  webhook_options = get_webhook_options(bot_config)
+
+  if bot_config.get("workers", 1) > 1:
+    run_sharded(bot_config, build_worker_application)
+  else:
+    app = build_application(bot_config)
+
+    if "metrics" in bot_config:
+      start_metrics_server(**bot_config["metrics"])
 
-  app.run_polling()
+    if webhook_options is None:
+      app.run_polling()
+    else:
+      app.run_webhook(**webhook_options)
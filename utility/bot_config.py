@@ -0,0 +1,21 @@
+import json
+import logging
+from functools import cache
+
+BOT_CONFIG_PATH = "bot_config.json"
+
+logger = logging.getLogger(__name__)
+
+@cache
+def get_bot_config() -> dict:
+  """
+  Loads and caches the contents of `bot_config.json`.
+  Returns an empty dict if the file does not exist, so optional settings can
+  always be read with `get_bot_config().get(key, default)`.
+  """
+  try:
+    with open(BOT_CONFIG_PATH) as bot_config_file:
+      return json.load(bot_config_file)
+  except FileNotFoundError:
+    logger.warning(f"{BOT_CONFIG_PATH} not found. Using default settings.")
+    return {}
@@ -1,19 +1,85 @@
-from enum import Enum
+from typing import NamedTuple, Optional
 from telegram import InlineKeyboardButton
 
-def make_callback_data(callback_type: Enum, data):
+from utility.constants import RequestCallbackType
+
+# Callback data format, version 1:
+#   <version><callback type><arg>.<arg>...
+# where the version is "1", the callback type is its enum value as a single
+# base 36 digit, and each arg is an integer in base 36 (with a leading "-" if
+# negative). For example, acknowledging request 123456 encodes as "112n9c".
+# Even 64-bit request IDs fit within InlineKeyboardButton.MAX_CALLBACK_DATA.
+#
+# Version 0 was "RequestCallbackType.<NAME>#<arg>#<arg>...". It is still parsed
+# because keyboards already sent in chats keep their old callback data.
+
+CALLBACK_DATA_VERSION = "1"
+
+# callback types of the buttons on request notifications, whose first arg is the request ID
+REQUEST_CALLBACK_TYPES = frozenset((
+  RequestCallbackType.ACKNOWLEDGE,
+  RequestCallbackType.APPROVER_NOTIFIED,
+  RequestCallbackType.APPROVE,
+  RequestCallbackType.REJECT,
+  RequestCallbackType.UNDO_APPROVE,
+  RequestCallbackType.UNDO_REJECT,
+))
+LEGACY_CALLBACK_TYPE_PREFIX = "RequestCallbackType."
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+class CallbackData(NamedTuple):
+  callback_type: RequestCallbackType
+  args: tuple
+
+  @property
+  def request_id(self) -> int:
+    return self.args[0]
+
+def encode_base36(number: int) -> str:
+  if number < 0:
+    return "-" + encode_base36(-number)
+
+  digits = []
+  while True:
+    number, digit = divmod(number, 36)
+    digits.append(BASE36_DIGITS[digit])
+    if number == 0:
+      return "".join(reversed(digits))
+
+def make_callback_data(callback_type: RequestCallbackType, data):
   """
   Constructs callback data for a `telegram.InlineKeyboardButton`.
+  `data` must be a sequence of integers.
   Throws if length of resulting callback data is not within
   [InlineKeyboardButton.MIN_CALLBACK_DATA, InlineKeyboardButton.MAX_CALLBACK_DATA].
   """
-  data = "#".join((str(callback_type), *(str(x) for x in data)))
+  data = CALLBACK_DATA_VERSION + BASE36_DIGITS[callback_type.value] + \
+         ".".join(encode_base36(int(x)) for x in data)
   if not InlineKeyboardButton.MIN_CALLBACK_DATA <= len(data) <= InlineKeyboardButton.MAX_CALLBACK_DATA:
     raise ValueError
   return data
 
-def parse_callback_data(callback_data: str):
-  return callback_data.split("#")[1:]
+def parse_callback_data(callback_data: str) -> Optional[CallbackData]:
+  """Returns None if `callback_data` was not made by `make_callback_data`."""
+  try:
+    if callback_data.startswith(LEGACY_CALLBACK_TYPE_PREFIX):
+      callback_type_name, *args = callback_data[len(LEGACY_CALLBACK_TYPE_PREFIX):].split("#")
+      return CallbackData(RequestCallbackType[callback_type_name], tuple(int(arg) for arg in args))
+
+    if callback_data[0] != CALLBACK_DATA_VERSION:
+      return None
+
+    args = callback_data[2:]
+    return CallbackData(
+      RequestCallbackType(int(callback_data[1], 36)),
+      tuple(int(arg, 36) for arg in args.split(".")) if args else (),
+    )
+  except (IndexError, KeyError, ValueError):
+    return None
 
-def match_callback_type(callback_type: Enum):
-  return lambda callback_data: callback_data.split("#")[0] == str(callback_type)
+def get_callback_request_id(callback_data: Optional[str]) -> Optional[int]:
+  """Returns the ID of the request whose notification has the button, or None for other buttons."""
+  parsed = parse_callback_data(callback_data) if callback_data else None
+  if parsed is None or parsed.callback_type not in REQUEST_CALLBACK_TYPES or not parsed.args:
+    return None
+  return parsed.request_id
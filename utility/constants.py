@@ -1,5 +1,5 @@
 from inspect import cleandoc
-from enum import Enum
+from enum import Enum, IntEnum
 from telegram.ext import filters
 
 HELP_MESSAGE = cleandoc("""
@@ -56,6 +56,23 @@ FIELD_NAME_MAPPINGS = {
   },
 }
 
+# Fields that are dates or datetimes, which are stored in Request.info as Unix timestamps
+DATE_FIELD_NAMES = {"date", "start_date", "end_date"}
+DATETIME_FIELD_NAMES = {"time"}
+
+# Fields giving the first and last day a request applies to, for the parade
+# state. Other request types are not counted.
+PARADE_STATE_DAY_FIELDS = {
+  "MC notification": ("start_date", "end_date"),
+  "report sick notification": ("time", "time"),
+  "BCP clearance request": ("date", "date"),
+  "IPPT booking request": ("date", "date"),
+}
+
+# Upper bound on the number of SDO groups notified of a new request at once.
+# Overridden by "max_concurrent_notifications" in bot_config.json.
+DEFAULT_MAX_CONCURRENT_NOTIFICATIONS = 8
+
 REQUEST_TYPE_REQUIRES_APPROVAL = {
   "BCP clearance request": True,
   "report sick notification": True,
@@ -122,10 +139,10 @@ HOTOConversationState = Enum("HOTOConversationState", [
   "IN_PROGRESS",
 ])
 
-# RequestCallbackType types must not contain "#" because all callback data
-# parsers split by that character.
-# Enum members containing "#" are inaccessible through dot notation but this is
-# just in case someone attempts to pull something stupid using getattr().
+# Callback data encodes RequestCallbackType members by value as a single base 36
+# digit (see utility/callback_data.py), so there can be at most 35 members.
+# Only append new members; reordering them would change the meaning of
+# buttons that have already been sent.
 RequestCallbackType = Enum("RequestCallbackType", [
   "ACKNOWLEDGE",
   "APPROVER_NOTIFIED",
@@ -133,6 +150,15 @@ RequestCallbackType = Enum("RequestCallbackType", [
   "REJECT",
   "UNDO_APPROVE",
   "UNDO_REJECT",
+  "PENDING_NEXT_PAGE",
+  "PENDING_PREVIOUS_PAGE",
+])
+
+# Lower values are sent first when outgoing Bot API calls are queued.
+OutboundPriority = IntEnum("OutboundPriority", [
+  "PRIVATE_CHAT", # replies and verdicts to trainees
+  "GROUP_CHAT", # messages to SDO groups
+  "KEYBOARD_EDIT", # inline keyboard updates, which are superseded quickly
 ])
 
 RequestStatus = Enum("RequestStatus", [
@@ -144,3 +170,12 @@ RequestStatus = Enum("RequestStatus", [
   "APPROVAL_REVOKED",
   "REJECTION_REVOKED",
 ])
+
+# Statuses of requests still awaiting action, in the order /pending lists them
+OPEN_REQUEST_STATUSES = (
+  RequestStatus.PENDING_ACKNOWLEDGEMENT,
+  RequestStatus.ACKNOWLEDGED,
+  RequestStatus.APPROVER_NOTIFIED,
+  RequestStatus.APPROVAL_REVOKED,
+  RequestStatus.REJECTION_REVOKED,
+)
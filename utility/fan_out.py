@@ -0,0 +1,20 @@
+import asyncio
+
+async def fan_out(coroutine_functions, max_concurrency: int):
+  """
+  Awaits the coroutines returned by each of `coroutine_functions` concurrently,
+  with at most `max_concurrency` of them in flight at any time.
+  Returns results in the same order as `coroutine_functions`.
+  Exceptions are returned in place of results instead of being raised, so one
+  failing coroutine does not affect the others.
+  """
+  semaphore = asyncio.Semaphore(max_concurrency)
+
+  async def run(coroutine_function):
+    async with semaphore:
+      return await coroutine_function()
+
+  return await asyncio.gather(
+    *(run(coroutine_function) for coroutine_function in coroutine_functions),
+    return_exceptions=True,
+  )
@@ -1,19 +1,27 @@
 from copy import deepcopy
-from datetime import datetime, date
+from datetime import datetime, date, timezone, timedelta
 
-from utility.constants import FIELD_NAME_MAPPINGS
+from utility.constants import FIELD_NAME_MAPPINGS, DATE_FIELD_NAMES, DATETIME_FIELD_NAMES
 
-def summarize_request(request_type, fields):
-  def stringify_field(value):
-    if isinstance(value, datetime):
-      return datetime.strftime(value, "%d%m%y %H%MH")
-    elif isinstance(value, date):
-      return datetime.strftime(value, "%d%m%y")
-    elif isinstance(value, list):
-      return "\n" + "\n".join(f"{i+1}. {item}" for i, item in enumerate(value))
-    else:
-      return str(value)
+def stringify_field(value):
+  if isinstance(value, datetime):
+    return datetime.strftime(value, "%d%m%y %H%MH")
+  elif isinstance(value, date):
+    return datetime.strftime(value, "%d%m%y")
+  elif isinstance(value, list):
+    return "\n" + "\n".join(f"{i+1}. {item}" for i, item in enumerate(value))
+  else:
+    return str(value)
+
+def decode_field(field_name, value):
+  # dates and datetimes are stored in Request.info as Unix timestamps (see complete_request)
+  if field_name in DATETIME_FIELD_NAMES:
+    return datetime.fromtimestamp(value, tz=timezone(timedelta(hours=8)))
+  elif field_name in DATE_FIELD_NAMES:
+    return datetime.fromtimestamp(value, tz=timezone(timedelta(hours=8))).date()
+  return value
 
+def summarize_request(request_type, fields):
   return "\n".join(
     f"{FIELD_NAME_MAPPINGS[request_type][field_name]}: "
     f"{stringify_field(fields[field_name])}" for field_name in fields
@@ -0,0 +1,36 @@
+from collections import OrderedDict
+from typing import NamedTuple, Any, Optional
+import time
+
+class CacheEntry(NamedTuple):
+  value: Any
+  is_fresh: bool
+
+class TTLCache:
+  """
+  Least-recently-used cache holding at most `max_size` entries.
+  Entries older than `ttl` seconds are stale. Stale entries are still returned
+  (marked as such) so that callers can serve them while refreshing.
+  """
+
+  def __init__(self, max_size: int, ttl: float):
+    self.max_size = max_size
+    self.ttl = ttl
+    self._entries = OrderedDict()
+
+  def get(self, key) -> Optional[CacheEntry]:
+    if key not in self._entries:
+      return None
+
+    self._entries.move_to_end(key)
+    value, set_time = self._entries[key]
+    return CacheEntry(value, time.monotonic() - set_time < self.ttl)
+
+  def set(self, key, value):
+    self._entries[key] = (value, time.monotonic())
+    self._entries.move_to_end(key)
+    if len(self._entries) > self.max_size:
+      self._entries.popitem(last=False)
+
+  def __len__(self):
+    return len(self._entries)